@@ -2,6 +2,8 @@
 Google Analytics Dashboard with Streamlit
 A professional, interactive dashboard for analyzing Google Analytics 4 data.
 """
+import base64
+import numpy as np
 import streamlit as st
 import pandas as pd
 from pathlib import Path
@@ -9,21 +11,22 @@ from pathlib import Path
 # Import custom modules
 from src.data_loader import (
     get_data,
-    get_unique_campaigns,
-    get_unique_channels,
     get_unique_urls,
+    get_date_window_options,
     filter_data,
-    aggregate_by_event_action,
-    get_all_event_actions,
-    get_all_channels
+    build_url_index,
+    select_urls,
+    aggregate_landing_comparison,
 )
 from src.filters import (
     render_date_filter,
     render_campaign_filter,
     render_channel_filter,
+    match_url_options,
 )
 from src.visualizations import render_all_comparison_charts
 from src.metrics import (
+    get_event_totals,
     calculate_leads,
     calculate_start_rate,
     calculate_end_rate,
@@ -36,9 +39,15 @@ from src.ai_analysis import render_ai_analysis
 from src.report_generator import render_report_section, init_report_session
 from config.config import (
     PAGE_TITLE, PAGE_ICON, LAYOUT,
-    GA_PROPERTY_ID, GA_CREDENTIALS_PATH, USE_DEFAULT_CREDENTIALS
+    GA_PROPERTY_ID, GA_CREDENTIALS_PATH, USE_DEFAULT_CREDENTIALS,
+    CACHE_TTL_SECONDS
 )
 
+# Copy-on-Write makes the landing frames below safe to alias instead of copy
+# (always on from pandas 3.0, where the option is deprecated)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
 # Page configuration
 st.set_page_config(
     page_title=PAGE_TITLE,
@@ -105,11 +114,15 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Header with logo (aligned vertically)
+@st.cache_resource
+def load_logo_base64(path: str) -> str:
+    """Read and base64-encode the header logo once per process."""
+    return base64.b64encode(Path(path).read_bytes()).decode()
+
+
 logo_path = Path("assets/enpal-logo.png")
 if logo_path.exists():
-    import base64
-    with open(logo_path, "rb") as f:
-        logo_base64 = base64.b64encode(f.read()).decode()
+    logo_base64 = load_logo_base64(str(logo_path))
     st.markdown(f"""
         <div class="header-container">
             <img src="data:image/png;base64,{logo_base64}" width="180">
@@ -121,14 +134,24 @@ else:
 st.markdown("---")
 
 # Load data
-with st.spinner("Loading GA4 data..."):
-    df, _ = get_data(
-        property_id=GA_PROPERTY_ID,
-        credentials_path=GA_CREDENTIALS_PATH,
-        use_default_credentials=USE_DEFAULT_CREDENTIALS
+# cache_resource hands every rerun the same DataFrame object instead of an
+# unpickled copy. GA4 data is not per-user, so sharing it across sessions is
+# fine as long as nothing downstream mutates it.
+@st.cache_resource(ttl=CACHE_TTL_SECONDS, show_spinner="Loading GA4 data...")
+def load_dashboard_data(property_id: str, credentials_path: str, use_default_credentials: bool):
+    """Load GA4 data once per TTL window and share it across reruns and sessions."""
+    return get_data(
+        property_id=property_id,
+        credentials_path=credentials_path,
+        use_default_credentials=use_default_credentials
     )
 
+
+df, metadata = load_dashboard_data(GA_PROPERTY_ID, GA_CREDENTIALS_PATH, USE_DEFAULT_CREDENTIALS)
+
 if df.empty:
+    # Drop the failed/empty load so the next rerun asks GA4 again
+    load_dashboard_data.clear()
     st.error("No data available. Please check your data source configuration.")
     st.stop()
 
@@ -139,10 +162,11 @@ st.sidebar.header("Global Filters")
 start_date, end_date = render_date_filter(df)
 
 # Get campaigns and channels with counts for the current date range
-date_filtered_df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-campaigns_with_counts = get_unique_campaigns(date_filtered_df)
-channels_with_counts = get_unique_channels(date_filtered_df)
-urls_with_counts = get_unique_urls(date_filtered_df)
+# (memoized per date window, so URL search/selection reruns skip the groupbys)
+data_version = metadata.get('query_time', '')
+campaigns_with_counts, channels_with_counts, urls_with_counts = get_date_window_options(
+    df, data_version, start_date, end_date
+)
 
 # Campaign filter
 selected_campaigns = render_campaign_filter(campaigns_with_counts)
@@ -150,19 +174,33 @@ selected_campaigns = render_campaign_filter(campaigns_with_counts)
 # Channel filter
 selected_channels = render_channel_filter(channels_with_counts)
 
-# Apply global filters (without URL filter - that will be per-column)
-base_filtered_df = filter_data(
-    df,
-    start_date,
-    end_date,
-    selected_campaigns if selected_campaigns else None,
-    selected_channels if selected_channels else None,
-    None  # No URL filter at global level
-)
-
-# Get URLs available after global filters
-available_urls = get_unique_urls(base_filtered_df)
-url_options = [url for url, count in available_urls]
+# Identifies the current global filter state; data derived from it is cached on this key
+filter_key = (data_version, start_date, end_date, tuple(selected_campaigns), tuple(selected_channels))
+
+# Global filter results only change with filter_key: rebuild them when it changes,
+# otherwise reuse this session's frame (URL search/selection reruns skip the filter)
+if st.session_state.get('url_state_key') != filter_key:
+    # Apply global filters (without URL filter - that will be per-column)
+    base_filtered_df = filter_data(
+        df,
+        start_date,
+        end_date,
+        selected_campaigns if selected_campaigns else None,
+        selected_channels if selected_channels else None,
+        None  # No URL filter at global level
+    )
+    st.session_state.base_filtered_df = base_filtered_df
+    # The URL index holds row positions in base_filtered_df, so it is cached alongside it
+    st.session_state.url_index = build_url_index(base_filtered_df)
+    # Get URLs available after global filters (plus a lowercase copy for search);
+    # stored as a tuple so both multiselects share one immutable options object
+    url_options = tuple(url for url, count in get_unique_urls(base_filtered_df))
+    st.session_state.url_options = url_options
+    st.session_state.url_options_lower = np.array([url.lower() for url in url_options], dtype=str)
+    st.session_state.url_state_key = filter_key
+base_filtered_df = st.session_state.base_filtered_df
+url_index = st.session_state.url_index
+url_options = st.session_state.url_options
 
 # Landing Page Comparison
 st.markdown("## Landing Page Comparison")
@@ -170,54 +208,80 @@ st.markdown("## Landing Page Comparison")
 # Create two columns for comparison
 col_old, col_new = st.columns(2)
 
-# Store url_options in session state for callbacks
-st.session_state.url_options = url_options
-
 # Callback functions (defined before columns so they capture correctly)
 def select_all_old_callback():
-    search = st.session_state.get('search_old', '')
-    opts = st.session_state.get('url_options', [])
-    filtered = [url for url in opts if search.lower() in url.lower()] if search else opts
+    filtered = match_url_options(
+        st.session_state.url_options,
+        st.session_state.url_options_lower,
+        st.session_state.get('search_old', '')
+    )
     # Replace selection with filtered results
-    st.session_state.url_filter_old = filtered
+    st.session_state.url_filter_old = list(filtered)
 
 def clear_old_callback():
     st.session_state.url_filter_old = []
 
 def select_all_new_callback():
-    search = st.session_state.get('search_new', '')
-    opts = st.session_state.get('url_options', [])
-    filtered = [url for url in opts if search.lower() in url.lower()] if search else opts
+    filtered = match_url_options(
+        st.session_state.url_options,
+        st.session_state.url_options_lower,
+        st.session_state.get('search_new', '')
+    )
     # Replace selection with filtered results
-    st.session_state.url_filter_new = filtered
+    st.session_state.url_filter_new = list(filtered)
 
 def clear_new_callback():
     st.session_state.url_filter_new = []
 
-# --- OLD LANDING COLUMN ---
-with col_old:
-    st.markdown('<div class="comparison-header old-landing">🔶 OLD LANDING</div>', unsafe_allow_html=True)
+def render_event_table(event_data: pd.DataFrame, key: str):
+    """Render an Event Actions table with its CSV download button."""
+    if not event_data.empty:
+        render_download_button(event_data, key=key)
+        st.dataframe(event_data, width="stretch", hide_index=True)
+    else:
+        st.info("No data available for selected filters")
 
-    # Search input for Old Landing
-    search_old = st.text_input(
-        "Search URLs (Old Landing)",
-        key="search_old",
+@st.fragment
+def render_url_search(side: str, label: str, select_all_callback, clear_callback):
+    """
+    Render the URL search box and its Select All / Clear buttons.
+    Runs as a fragment so keystrokes only rerun this block; the URL options are
+    read from session_state instead of being passed in.
+    """
+    search = st.text_input(
+        f"Search URLs ({label})",
+        key=f"search_{side}",
         placeholder="Type to filter (e.g. /ar, /it/fotovoltaico...)"
     )
 
     # Filter options based on search (for display)
-    filtered_options_old = [url for url in url_options if search_old.lower() in url.lower()] if search_old else url_options
+    filtered_options = match_url_options(
+        st.session_state.url_options,
+        st.session_state.url_options_lower,
+        search
+    )
 
     # Select All Matching and Clear buttons (compact layout)
     col_btn1, col_btn2 = st.columns([1, 1], gap="small")
     with col_btn1:
-        st.button("Select All", key="select_all_old", on_click=select_all_old_callback, disabled=len(filtered_options_old) == 0, use_container_width=True)
+        select_all_clicked = st.button("Select All", key=f"select_all_{side}", on_click=select_all_callback, disabled=len(filtered_options) == 0, width="stretch")
     with col_btn2:
-        st.button("Clear", key="clear_old", on_click=clear_old_callback, use_container_width=True)
+        clear_clicked = st.button("Clear", key=f"clear_{side}", on_click=clear_callback, width="stretch")
 
     # Show count of matching URLs
-    if search_old:
-        st.caption(f"Found {len(filtered_options_old)} matching URLs")
+    if search:
+        st.caption(f"Found {len(filtered_options)} matching URLs")
+
+    # The selection lives outside the fragment, so a changed selection needs a full rerun
+    if select_all_clicked or clear_clicked:
+        st.rerun()
+
+# --- OLD LANDING COLUMN ---
+with col_old:
+    st.markdown('<div class="comparison-header old-landing">🔶 OLD LANDING</div>', unsafe_allow_html=True)
+
+    # Search box and Select All / Clear buttons (rerun on their own while typing)
+    render_url_search("old", "Old Landing", select_all_old_callback, clear_old_callback)
 
     # URL multiselect for Old Landing
     selected_urls_old = st.multiselect(
@@ -230,69 +294,46 @@ with col_old:
 
     # Filter data for old landing
     if selected_urls_old:
-        old_landing_df = base_filtered_df[base_filtered_df['url'].isin(selected_urls_old)]
+        old_landing_df = select_urls(base_filtered_df, selected_urls_old, url_index)
     else:
-        old_landing_df = base_filtered_df.copy()
+        old_landing_df = base_filtered_df
 
-    # KPIs for Old Landing
+    # KPIs for Old Landing (one event aggregation shared by all KPIs)
+    event_totals_old = get_event_totals(old_landing_df)
     st.markdown("### KPIs")
     kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
 
     with kpi_col1:
-        leads_old = calculate_leads(old_landing_df)
+        leads_old = calculate_leads(old_landing_df, event_totals_old)
         st.metric(label="Leads", value=f"{leads_old:,}")
 
     with kpi_col2:
-        start_rate_old = calculate_start_rate(old_landing_df)
+        start_rate_old = calculate_start_rate(old_landing_df, event_totals_old)
         st.metric(label="Start Rate", value=f"{start_rate_old:.2f}%")
 
     with kpi_col3:
-        end_rate_old = calculate_end_rate(old_landing_df)
+        end_rate_old = calculate_end_rate(old_landing_df, event_totals_old)
         st.metric(label="End Rate", value=f"{end_rate_old:.2f}%")
 
     with kpi_col4:
-        reg_rate_old = calculate_registration_rate(old_landing_df)
+        reg_rate_old = calculate_registration_rate(old_landing_df, event_totals_old)
         st.metric(label="Reg Rate", value=f"{reg_rate_old:.2f}%")
     
     kpi_col5, kpi_col6 = st.columns([2, 2])
     with kpi_col5:
-        postcap_success_old = calculate_cap_success(old_landing_df)
+        postcap_success_old = calculate_cap_success(old_landing_df, event_totals_old)
         st.metric(label="PostCap Success", value=f"{postcap_success_old:.2f}%")
 
     # Data table for Old Landing
     st.markdown("### Event Actions")
-    event_data_old = aggregate_by_event_action(old_landing_df)
-
-    if not event_data_old.empty:
-        render_download_button(event_data_old, key="download_old")
-        st.dataframe(event_data_old, width="stretch", hide_index=True)
-    else:
-        st.info("No data available for selected filters")
+    event_table_old = st.container()  # filled below, once both URL selections are known
 
 # NEW LANDING COLUMN
 with col_new:
     st.markdown('<div class="comparison-header new-landing">🔷 NEW LANDING</div>', unsafe_allow_html=True)
 
-    # Search input for New Landing
-    search_new = st.text_input(
-        "Search URLs (New Landing)",
-        key="search_new",
-        placeholder="Type to filter (e.g. /ar, /it/fotovoltaico...)"
-    )
-
-    # Filter options based on search (for display)
-    filtered_options_new = [url for url in url_options if search_new.lower() in url.lower()] if search_new else url_options
-
-    # Select All Matching and Clear buttons (compact layout)
-    col_btn3, col_btn4 = st.columns([1, 1], gap="small")
-    with col_btn3:
-        st.button("Select All", key="select_all_new", on_click=select_all_new_callback, disabled=len(filtered_options_new) == 0, use_container_width=True)
-    with col_btn4:
-        st.button("Clear", key="clear_new", on_click=clear_new_callback, use_container_width=True)
-
-    # Show count of matching URLs
-    if search_new:
-        st.caption(f"Found {len(filtered_options_new)} matching URLs")
+    # Search box and Select All / Clear buttons (rerun on their own while typing)
+    render_url_search("new", "New Landing", select_all_new_callback, clear_new_callback)
 
     # URL multiselect for New Landing
     selected_urls_new = st.multiselect(
@@ -305,44 +346,48 @@ with col_new:
 
     # Filter data for new landing
     if selected_urls_new:
-        new_landing_df = base_filtered_df[base_filtered_df['url'].isin(selected_urls_new)]
+        new_landing_df = select_urls(base_filtered_df, selected_urls_new, url_index)
     else:
-        new_landing_df = base_filtered_df.copy()
+        new_landing_df = base_filtered_df
 
-    # KPIs for New Landing
+    # KPIs for New Landing (one event aggregation shared by all KPIs)
+    event_totals_new = get_event_totals(new_landing_df)
     st.markdown("### KPIs")
     kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
 
     with kpi_col1:
-        leads_new = calculate_leads(new_landing_df)
+        leads_new = calculate_leads(new_landing_df, event_totals_new)
         st.metric(label="Leads", value=f"{leads_new:,}")
 
     with kpi_col2:
-        start_rate_new = calculate_start_rate(new_landing_df)
+        start_rate_new = calculate_start_rate(new_landing_df, event_totals_new)
         st.metric(label="Start Rate", value=f"{start_rate_new:.2f}%")
 
     with kpi_col3:
-        end_rate_new = calculate_end_rate(new_landing_df)
+        end_rate_new = calculate_end_rate(new_landing_df, event_totals_new)
         st.metric(label="End Rate", value=f"{end_rate_new:.2f}%")
 
     with kpi_col4:
-        reg_rate_new = calculate_registration_rate(new_landing_df)
+        reg_rate_new = calculate_registration_rate(new_landing_df, event_totals_new)
         st.metric(label="Reg Rate", value=f"{reg_rate_new:.2f}%")
     
     kpi_col5, kpi_col6 = st.columns([2, 2])
     with kpi_col5:
-        postcap_success_new = calculate_cap_success(new_landing_df)
+        postcap_success_new = calculate_cap_success(new_landing_df, event_totals_new)
         st.metric(label="PostCap Success", value=f"{postcap_success_new:.2f}%")
 
     # Data table for New Landing
     st.markdown("### Event Actions")
-    event_data_new = aggregate_by_event_action(new_landing_df)
+    event_table_new = st.container()  # filled below, once both URL selections are known
 
-    if not event_data_new.empty:
-        render_download_button(event_data_new, key="download_new")
-        st.dataframe(event_data_new, width="stretch", hide_index=True)
-    else:
-        st.info("No data available for selected filters")
+# Event Actions tables for both landings from a single fused aggregation
+event_data_old, event_data_new = aggregate_landing_comparison(
+    base_filtered_df, selected_urls_old, selected_urls_new
+)
+with event_table_old:
+    render_event_table(event_data_old, key="download_old")
+with event_table_new:
+    render_event_table(event_data_new, key="download_new")
 
 st.markdown("---")
 
@@ -1,8 +1,57 @@
 """AI-powered analysis using Claude for the Google Analytics Dashboard."""
+from collections import OrderedDict
+
 import anthropic
 import pandas as pd
 import streamlit as st
-from config.config import ANTHROPIC_API_KEY
+from config.config import ANTHROPIC_API_KEY, CACHE_TTL_SECONDS
+from src.metrics import KPI_EVENTS, get_event_totals
+
+# Static instructions, sent as the system prompt so the prefix is identical
+# (and cacheable) across calls; only the data block changes per request
+ANALYSIS_SYSTEM_PROMPT = """Sei un analista di dati esperto. Analizzi dati di Google Analytics confrontando le performance della landing page OLD vs NEW per un funnel slider. Il periodo di analisi e i dati delle due landing sono forniti nel messaggio dell'utente.
+
+ISTRUZIONI IMPORTANTI:
+- Analizza TUTTI gli eventi presenti nella lista (event_action), non solo i KPI principali
+- Per ogni evento, considera sia il count totale che il ratio rispetto a "Enpal Source Cookie" (punto di partenza del funnel)
+- Confronta i numeri assoluti E le percentuali tra OLD e NEW
+
+Fornisci un'analisi COMPLETA in italiano che include:
+
+1. **Confronto KPI Principali**:
+   - Leads (slider-success): confronto numeri assoluti e variazione %
+   - Start Rate: confronto e variazione %
+   - End Rate: confronto e variazione %
+   - CAP Success (slider-success / Per quale tipo di edificio vuoi scoprire i bonus?): confronto e variazione %
+   - Registration Rate: confronto e variazione %
+
+2. **Analisi Completa del Funnel**:
+   - Analizza OGNI evento presente nei dati
+   - Per ogni step del funnel, indica: count OLD vs NEW, ratio OLD vs NEW
+   - Identifica dove ci sono le differenze maggiori tra le due landing
+
+3. **Drop-off Analysis**:
+   - Identifica i passaggi dove si perdono più utenti
+   - Calcola il drop-off tra step consecutivi del funnel
+   - Evidenzia differenze di drop-off tra OLD e NEW
+
+4. **Conclusione Finale**:
+   IMPORTANTE: Termina SEMPRE con una frase conclusiva chiara nel formato:
+   "**Nel periodo dal [data inizio] al [data fine], la landing page [OLD/NEW] ha performato meglio perché...**"
+   usando le date del PERIODO DI ANALISI.
+
+   Spiega brevemente il motivo principale (es: più leads, migliore conversion rate, etc.)
+
+Usa tabelle o elenchi puntati per rendere i confronti chiari e leggibili."""
+
+
+@st.cache_resource
+def get_anthropic_client() -> anthropic.Anthropic:
+    """
+    Create the Anthropic client once and share its connection pool across reruns and sessions.
+    Transient failures (429/5xx, connection errors) are retried with backoff by the client itself.
+    """
+    return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=3, timeout=60.0)
 
 
 def get_data_summary(df: pd.DataFrame, landing_type: str) -> dict:
@@ -19,14 +68,15 @@ def get_data_summary(df: pd.DataFrame, landing_type: str) -> dict:
     }
 
     if 'event_action' in df.columns:
-        event_counts = df.groupby('event_action')['count'].sum().to_dict()
-        summary["event_breakdown"] = event_counts
-
-        enpal_cookie = event_counts.get("Enpal Source Cookie", 0)
-        first_question = event_counts.get("A quale prodotto sei interessato?", 0)
-        last_question = event_counts.get("Per quale prodotto vuoi scoprire i bonus?", 0)
-        building_type = event_counts.get("Per quale tipo di edificio vuoi scoprire i bonus?", 0)
-        slider_success = event_counts.get("slider-success", 0)
+        # One bincount over the event_action category codes (see get_event_totals),
+        # keeping the events present in this slice, ordered by count (ties keep name order)
+        event_totals = get_event_totals(df)
+        event_totals = event_totals[event_totals > 0].sort_values(ascending=False, kind='stable')
+        summary["event_breakdown"] = event_totals.to_dict()
+
+        enpal_cookie, last_question, building_type, slider_success = (
+            event_totals.reindex(KPI_EVENTS, fill_value=0).tolist()
+        )
 
         summary["leads"] = slider_success
         summary["start_rate"] = (last_question / enpal_cookie * 100) if enpal_cookie > 0 else 0
@@ -34,83 +84,89 @@ def get_data_summary(df: pd.DataFrame, landing_type: str) -> dict:
         summary["cap_success"] = (slider_success / building_type * 100) if building_type > 0 else 0
         summary["registration_rate"] = (slider_success / enpal_cookie * 100) if enpal_cookie > 0 else 0
 
-        # Calculate ratios between consecutive funnel steps
+        # Ratio of every event vs the start of the funnel, computed column-wise
         summary["step_ratios"] = {}
-        sorted_events = sorted(event_counts.items(), key=lambda x: -x[1])
-        for i, (event, count) in enumerate(sorted_events):
-            if enpal_cookie > 0:
-                summary["step_ratios"][event] = {
-                    "count": count,
-                    "ratio_vs_start": (count / enpal_cookie * 100)
-                }
+        if enpal_cookie > 0:
+            ratios = event_totals / enpal_cookie * 100
+            summary["step_ratios"] = {
+                event: {"count": count, "ratio_vs_start": ratio}
+                for event, count, ratio in zip(event_totals.index, event_totals.tolist(), ratios.tolist())
+            }
 
     return summary
 
 
-def analyze_with_claude(old_data: pd.DataFrame, new_data: pd.DataFrame, start_date: str, end_date: str) -> str:
-    """Use Claude to analyze and compare OLD vs NEW landing page performance."""
+# Upper bound on remembered analyses (oldest are dropped first)
+ANALYSIS_CACHE_MAX_ENTRIES = 32
+
+
+@st.cache_resource(ttl=CACHE_TTL_SECONDS)
+def get_analysis_cache() -> OrderedDict:
+    """
+    Completed analyses keyed by their user prompt, shared across sessions.
+    The prompt holds the period and both data summaries, so an identical prompt
+    means an identical question. Cleared every CACHE_TTL_SECONDS.
+    """
+    return OrderedDict()
+
+
+def stream_claude_analysis(old_data: pd.DataFrame, new_data: pd.DataFrame, start_date: str, end_date: str):
+    """
+    Use Claude to analyze and compare OLD vs NEW landing page performance.
+    Yields the response text as it is generated, so it can be rendered with st.write_stream.
+    """
     if not ANTHROPIC_API_KEY:
-        return "Anthropic API key not configured. Please add ANTHROPIC_API_KEY to your .env file."
+        yield "Anthropic API key not configured. Please add ANTHROPIC_API_KEY to your .env file."
+        return
 
     old_summary = get_data_summary(old_data, "OLD Landing")
     new_summary = get_data_summary(new_data, "NEW Landing")
 
-    prompt = f"""Sei un analista di dati esperto. Analizza i seguenti dati di Google Analytics confrontando le performance della landing page OLD vs NEW per un funnel slider.
-
-PERIODO DI ANALISI: Dal {start_date} al {end_date}
+    prompt = f"""PERIODO DI ANALISI: Dal {start_date} al {end_date}
 
 DATI OLD LANDING PAGE:
 {format_summary(old_summary)}
 
 DATI NEW LANDING PAGE:
-{format_summary(new_summary)}
-
-ISTRUZIONI IMPORTANTI:
-- Analizza TUTTI gli eventi presenti nella lista (event_action), non solo i KPI principali
-- Per ogni evento, considera sia il count totale che il ratio rispetto a "Enpal Source Cookie" (punto di partenza del funnel)
-- Confronta i numeri assoluti E le percentuali tra OLD e NEW
-
-Fornisci un'analisi COMPLETA in italiano che include:
-
-1. **Confronto KPI Principali**:
-   - Leads (slider-success): confronto numeri assoluti e variazione %
-   - Start Rate: confronto e variazione %
-   - End Rate: confronto e variazione %
-   - CAP Success (slider-success / Per quale tipo di edificio vuoi scoprire i bonus?): confronto e variazione %
-   - Registration Rate: confronto e variazione %
-
-2. **Analisi Completa del Funnel**:
-   - Analizza OGNI evento presente nei dati
-   - Per ogni step del funnel, indica: count OLD vs NEW, ratio OLD vs NEW
-   - Identifica dove ci sono le differenze maggiori tra le due landing
-
-3. **Drop-off Analysis**:
-   - Identifica i passaggi dove si perdono più utenti
-   - Calcola il drop-off tra step consecutivi del funnel
-   - Evidenzia differenze di drop-off tra OLD e NEW
-
-4. **Conclusione Finale**:
-   IMPORTANTE: Termina SEMPRE con una frase conclusiva chiara nel formato:
-   "**Nel periodo dal {start_date} al {end_date}, la landing page [OLD/NEW] ha performato meglio perché...**"
-
-   Spiega brevemente il motivo principale (es: più leads, migliore conversion rate, etc.)
+{format_summary(new_summary)}"""
 
-Usa tabelle o elenchi puntati per rendere i confronti chiari e leggibili."""
+    # Same summaries and period as an earlier analysis: reuse its answer
+    analysis_cache = get_analysis_cache()
+    cached_analysis = analysis_cache.get(prompt)
+    if cached_analysis is not None:
+        yield cached_analysis
+        return
 
     try:
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-        message = client.messages.create(
+        client = get_anthropic_client()
+        with client.messages.stream(
             model="claude-sonnet-4-20250514",
             max_tokens=2048,
+            system=[
+                {"type": "text", "text": ANALYSIS_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+            ],
             messages=[
                 {"role": "user", "content": prompt}
             ]
-        )
-        return message.content[0].text
+        ) as stream:
+            chunks = []
+            for text in stream.text_stream:
+                chunks.append(text)
+                yield text
+
+        # Only complete responses are cached; errors below are retried next time
+        analysis_cache[prompt] = "".join(chunks)
+        while len(analysis_cache) > ANALYSIS_CACHE_MAX_ENTRIES:
+            analysis_cache.popitem(last=False)
     except anthropic.APIError as e:
-        return f"Error calling Claude API: {str(e)}"
+        yield f"Error calling Claude API: {str(e)}"
     except Exception as e:
-        return f"Unexpected error: {str(e)}"
+        yield f"Unexpected error: {str(e)}"
+
+
+def analyze_with_claude(old_data: pd.DataFrame, new_data: pd.DataFrame, start_date: str, end_date: str) -> str:
+    """Use Claude to analyze and compare OLD vs NEW landing page performance."""
+    return "".join(stream_claude_analysis(old_data, new_data, start_date, end_date))
 
 
 def format_summary(summary: dict) -> str:
@@ -169,7 +225,6 @@ def render_ai_analysis(old_data: pd.DataFrame, new_data: pd.DataFrame, start_dat
             st.rerun()
     else:
         if st.button("Vedi i motivi", type="primary"):
-            with st.spinner("Claude sta analizzando i dati..."):
-                analysis = analyze_with_claude(old_data, new_data, start_date, end_date)
-                st.session_state.last_ai_analysis = analysis
-                st.markdown(analysis)
+            # Render tokens as they arrive instead of waiting for the full response
+            analysis = st.write_stream(stream_claude_analysis(old_data, new_data, start_date, end_date))
+            st.session_state.last_ai_analysis = analysis
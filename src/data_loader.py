@@ -1,9 +1,28 @@
 """Data loading functions for the Google Analytics Dashboard."""
+import numpy as np
 import pandas as pd
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import time
 import pytz
 
+# GA4 client libraries are imported once at module load; the module stays
+# importable without them and only fails when GA4 data is actually requested
+try:
+    import google.auth
+    from google.analytics.data_v1beta import BetaAnalyticsDataClient
+    from google.analytics.data_v1beta.types import (
+        DateRange,
+        Dimension,
+        Metric,
+        RunReportRequest,
+        RunReportResponse,
+    )
+    from google.oauth2 import service_account
+except ImportError:
+    BetaAnalyticsDataClient = None
+
 from config.config import (
     GA4_ROW_LIMIT,
     GA4_DATE_RANGE_DAYS,
@@ -12,14 +31,14 @@ from config.config import (
 )
 
 
+@st.cache_resource
 def get_gcp_credentials():
     """
     Get Google Cloud credentials from Streamlit secrets (for Streamlit Cloud deployment).
+    Cached as a resource so the service-account key is parsed once per process.
     Returns credentials object or None.
     """
     try:
-        from google.oauth2 import service_account
-
         # Try Streamlit secrets (for Streamlit Cloud deployment)
         if "gcp_service_account" in st.secrets:
             credentials = service_account.Credentials.from_service_account_info(
@@ -33,302 +52,251 @@ def get_gcp_credentials():
     return None
 
 
-@st.cache_data(ttl=CACHE_TTL_SECONDS)
-def load_ga4_data(property_id: str, credentials_path: str = None, use_default_credentials: bool = True) -> dict:
+@st.cache_resource
+def get_ga4_client(credentials_path: str = None, use_default_credentials: bool = True):
     """
-    Load data from Google Analytics 4 API with pagination support.
-    Returns a dict with 'data' (DataFrame) and 'metadata' (info about the query).
+    Get a GA4 Data API client, created once per credentials setup and shared by
+    all loaders, so its gRPC channel and OAuth token are reused.
+    Returns the client, or None if no credentials are available.
     """
-    try:
-        from google.analytics.data_v1beta import BetaAnalyticsDataClient
-        from google.analytics.data_v1beta.types import (
-            DateRange,
-            Dimension,
-            Metric,
-            RunReportRequest,
-        )
-        import google.auth
-
-        # Initialize client
-        if use_default_credentials:
-            credentials, project = google.auth.default()
-            client = BetaAnalyticsDataClient(credentials=credentials)
-        elif credentials_path:
-            client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
-        else:
-            # Try Streamlit secrets (for Streamlit Cloud deployment)
-            gcp_creds = get_gcp_credentials()
-            if gcp_creds:
-                client = BetaAnalyticsDataClient(credentials=gcp_creds)
-            else:
-                st.error("No credentials provided for GA4 API. Add 'gcp_service_account' to Streamlit secrets.")
-                return {'data': pd.DataFrame(), 'metadata': {}}
-
-        # Define date range with explicit timezone
-        tz = pytz.timezone(GA4_TIMEZONE)
-        end_date = datetime.now(tz)
-        start_date = end_date - timedelta(days=GA4_DATE_RANGE_DAYS)
-
-        # GA4 API has a hard limit of 250,000 rows per request
-        # We need to paginate to get all data
-        GA4_PAGE_SIZE = 250000
-        all_rows = []
-        offset = 0
-        total_pages = 0
-        max_pages = 10  # Safety limit to prevent infinite loops
-
-        while total_pages < max_pages:
-            request = RunReportRequest(
-                property=f"properties/{property_id}",
-                dimensions=[
-                    Dimension(name="date"),
-                    Dimension(name="customEvent:event_action"),
-                    Dimension(name="sessionCampaignName"),
-                    Dimension(name="sessionSource"),
-                    Dimension(name="landingPage"),
-                ],
-                metrics=[
-                    Metric(name="eventCount"),
-                ],
-                date_ranges=[
-                    DateRange(
-                        start_date=start_date.strftime("%Y-%m-%d"),
-                        end_date=end_date.strftime("%Y-%m-%d")
-                    )
-                ],
-                limit=GA4_PAGE_SIZE,
-                offset=offset,
-            )
+    if BetaAnalyticsDataClient is None:
+        raise ImportError("google-analytics-data is not installed")
+
+    if use_default_credentials:
+        credentials, project = google.auth.default()
+        return BetaAnalyticsDataClient(credentials=credentials)
+    if credentials_path:
+        return BetaAnalyticsDataClient.from_service_account_file(credentials_path)
+
+    # Try Streamlit secrets (for Streamlit Cloud deployment)
+    gcp_creds = get_gcp_credentials()
+    if gcp_creds:
+        return BetaAnalyticsDataClient(credentials=gcp_creds)
+    return None
 
-            response = client.run_report(request)
-            total_pages += 1
-
-            # Extract rows from this page
-            page_rows = []
-            for row in response.rows:
-                page_rows.append({
-                    'date': row.dimension_values[0].value,
-                    'event_action': row.dimension_values[1].value,
-                    'campaign': row.dimension_values[2].value or '(not set)',
-                    'channel': row.dimension_values[3].value or '(not set)',
-                    'url': row.dimension_values[4].value or '(not set)',
-                    'count': int(row.metric_values[0].value),
-                })
-
-            all_rows.extend(page_rows)
-
-            # Check if we got all data (less than page size means last page)
-            if len(page_rows) < GA4_PAGE_SIZE:
-                break
-
-            # Move to next page
-            offset += GA4_PAGE_SIZE
-
-            # Check if we've reached the total row limit
-            if len(all_rows) >= GA4_ROW_LIMIT:
-                break
-
-        df = pd.DataFrame(all_rows)
-        if not df.empty:
-            df['date'] = pd.to_datetime(df['date'], format='%Y%m%d')
-
-        # Metadata for debugging
-        is_truncated = (
-            len(all_rows) >= GA4_ROW_LIMIT or
-            total_pages >= max_pages
-        )
 
-        metadata = {
-            'row_count': len(df),
-            'row_limit': GA4_ROW_LIMIT,
-            'is_truncated': is_truncated,
-            'pages_fetched': total_pages,
-            'date_range_start': start_date.strftime("%Y-%m-%d"),
-            'date_range_end': end_date.strftime("%Y-%m-%d"),
-            'timezone': GA4_TIMEZONE,
-            'query_time': datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S %Z"),
-            'channel_dimension': 'sessionSource',
-        }
+def get_report_date_range() -> tuple[str, str]:
+    """
+    GA4 report date range (start, end) as YYYY-MM-DD strings: the last
+    GA4_DATE_RANGE_DAYS days up to today in GA4_TIMEZONE. Day-quantized, so every
+    loader asks GA4 for the same range regardless of when it runs during the day.
+    """
+    today = datetime.now(pytz.timezone(GA4_TIMEZONE)).date()
+    start = today - timedelta(days=GA4_DATE_RANGE_DAYS)
+    return start.isoformat(), today.isoformat()
 
-        return {'data': df, 'metadata': metadata}
 
-    except Exception as e:
-        st.error(f"Error loading GA4 data: {str(e)}")
-        return {'data': pd.DataFrame(), 'metadata': {'error': str(e)}}
+def get_refresh_window() -> int:
+    """
+    Index of the current CACHE_TTL_SECONDS-long time window.
+    Disk-persisted caches ignore ttl, so the GA4 loaders take this as an argument:
+    a new window is a new cache key, which expires entries like a ttl would.
+    """
+    return int(time.time() // CACHE_TTL_SECONDS)
 
 
-def get_data(
-    property_id: str = None,
+@st.cache_data(persist="disk", max_entries=16)
+def load_ga4_data(
+    property_id: str,
     credentials_path: str = None,
-    use_default_credentials: bool = True
-) -> tuple[pd.DataFrame, dict]:
+    use_default_credentials: bool = True,
+    refresh_window: int = None
+) -> dict:
     """
-    Get data from Google Analytics 4 API.
-    Returns tuple of (DataFrame, metadata dict).
+    Load data from Google Analytics 4 API with pagination support.
+    Results are persisted to disk, so a restarted container reuses them until
+    refresh_window (see get_refresh_window) moves on. Errors are raised, not
+    returned, so a failed load is never cached; get_data reports them.
+    Returns a dict with 'data' (DataFrame) and 'metadata' (info about the query).
     """
-    if not property_id:
-        st.error("GA4 Property ID is required")
-        return pd.DataFrame(), {}
-    result = load_ga4_data(property_id, credentials_path, use_default_credentials)
-    return result['data'], result['metadata']
-
-
-@st.cache_data(ttl=CACHE_TTL_SECONDS)
-def get_all_event_actions(property_id: str, credentials_path: str = None, use_default_credentials: bool = True) -> list:
-    """Get ALL unique event_action values from GA4 (without other dimensions)."""
-    try:
-        from google.analytics.data_v1beta import BetaAnalyticsDataClient
-        from google.analytics.data_v1beta.types import (
-            DateRange,
-            Dimension,
-            Metric,
-            RunReportRequest,
-        )
-        import google.auth
-        from datetime import datetime, timedelta
-
-        # Initialize client
-        if use_default_credentials:
-            credentials, project = google.auth.default()
-            client = BetaAnalyticsDataClient(credentials=credentials)
-        elif credentials_path:
-            client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
-        else:
-            # Try Streamlit secrets (for Streamlit Cloud deployment)
-            gcp_creds = get_gcp_credentials()
-            if gcp_creds:
-                client = BetaAnalyticsDataClient(credentials=gcp_creds)
-            else:
-                return []
-
-        # Date range (last 90 days)
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=90)
-
-        # Query ONLY event_action dimension
-        request = RunReportRequest(
+    client = get_ga4_client(credentials_path, use_default_credentials)
+    if client is None:
+        raise RuntimeError("No credentials provided for GA4 API")
+
+    # Define date range with explicit timezone
+    tz = pytz.timezone(GA4_TIMEZONE)
+    start_date, end_date = get_report_date_range()
+
+    # GA4 API has a hard limit of 250,000 rows per request
+    # We need to paginate to get all data
+    GA4_PAGE_SIZE = 250000
+    # Collect one list per column (not one dict per row) so the DataFrame
+    # is built from ready columns without per-row type inference
+    dates, event_actions, campaigns, channels, urls = [], [], [], [], []
+    count_pages = []  # one int64 array per page
+    total_pages = 0
+    max_pages = 10  # Safety limit to prevent infinite loops
+
+    def page_request(offset: int) -> RunReportRequest:
+        return RunReportRequest(
             property=f"properties/{property_id}",
             dimensions=[
+                Dimension(name="date"),
                 Dimension(name="customEvent:event_action"),
-            ],
-            metrics=[
-                Metric(name="eventCount"),
-            ],
-            date_ranges=[
-                DateRange(
-                    start_date=start_date.strftime("%Y-%m-%d"),
-                    end_date=end_date.strftime("%Y-%m-%d")
-                )
-            ],
-            limit=10000,
-        )
-
-        response = client.run_report(request)
-
-        # Extract unique event_action values
-        event_actions = []
-        for row in response.rows:
-            event_actions.append({
-                'event_action': row.dimension_values[0].value,
-                'total_count': int(row.metric_values[0].value)
-            })
-
-        return event_actions
-
-    except Exception as e:
-        st.error(f"Error getting event actions: {str(e)}")
-        return []
-
-
-@st.cache_data(ttl=CACHE_TTL_SECONDS)
-def get_all_channels(property_id: str, credentials_path: str = None, use_default_credentials: bool = True) -> list:
-    """Get ALL unique channel (sessionSource) values from GA4."""
-    try:
-        from google.analytics.data_v1beta import BetaAnalyticsDataClient
-        from google.analytics.data_v1beta.types import (
-            DateRange,
-            Dimension,
-            Metric,
-            RunReportRequest,
-        )
-        import google.auth
-        from datetime import datetime, timedelta
-
-        # Initialize client
-        if use_default_credentials:
-            credentials, project = google.auth.default()
-            client = BetaAnalyticsDataClient(credentials=credentials)
-        elif credentials_path:
-            client = BetaAnalyticsDataClient.from_service_account_file(credentials_path)
-        else:
-            # Try Streamlit secrets (for Streamlit Cloud deployment)
-            gcp_creds = get_gcp_credentials()
-            if gcp_creds:
-                client = BetaAnalyticsDataClient(credentials=gcp_creds)
-            else:
-                return []
-
-        # Date range (last 90 days)
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=90)
-
-        # Query ONLY sessionSource dimension
-        request = RunReportRequest(
-            property=f"properties/{property_id}",
-            dimensions=[
+                Dimension(name="sessionCampaignName"),
                 Dimension(name="sessionSource"),
+                Dimension(name="landingPage"),
             ],
             metrics=[
                 Metric(name="eventCount"),
             ],
             date_ranges=[
-                DateRange(
-                    start_date=start_date.strftime("%Y-%m-%d"),
-                    end_date=end_date.strftime("%Y-%m-%d")
-                )
+                DateRange(start_date=start_date, end_date=end_date)
             ],
-            limit=10000,
+            limit=GA4_PAGE_SIZE,
+            offset=offset,
         )
 
-        response = client.run_report(request)
+    def extract_rows(response):
+        """Append the rows of one page to the column lists, one comprehension per column."""
+        # Read the underlying protobuf message: field access skips the
+        # proto-plus wrapper objects created on every attribute lookup
+        rows = RunReportResponse.pb(response).rows
+        dims = [row.dimension_values for row in rows]
+        dates.extend([d[0].value for d in dims])
+        event_actions.extend([d[1].value for d in dims])
+        campaigns.extend([d[2].value or '(not set)' for d in dims])
+        channels.extend([d[3].value or '(not set)' for d in dims])
+        urls.extend([d[4].value or '(not set)' for d in dims])
+        count_pages.append(np.fromiter(
+            (int(row.metric_values[0].value) for row in rows), dtype=np.int64, count=len(rows)
+        ))
+
+    # First page also tells us the total row count of the report
+    response = client.run_report(page_request(0))
+    total_pages += 1
+    extract_rows(response)
+
+    # Fetch the remaining pages (up to the row limit) concurrently; the
+    # client is thread-safe and each call mostly waits on the network
+    if len(response.rows) >= GA4_PAGE_SIZE:
+        row_total = min(response.row_count, GA4_ROW_LIMIT)
+        offsets = list(range(GA4_PAGE_SIZE, row_total, GA4_PAGE_SIZE))[:max_pages - 1]
+        if offsets:
+            with ThreadPoolExecutor(max_workers=min(8, len(offsets))) as executor:
+                # map() yields pages in offset order, so row order is preserved
+                for response in executor.map(lambda offset: client.run_report(page_request(offset)), offsets):
+                    total_pages += 1
+                    extract_rows(response)
+
+    df = pd.DataFrame()
+    if dates:
+        # Only ~GA4_DATE_RANGE_DAYS distinct date strings: parse each once and
+        # map rows back through the category codes. Day resolution is all GA4
+        # dates carry; seconds is the coarsest unit pandas supports
+        date_codes = pd.Categorical(dates)
+        days = pd.to_datetime(date_codes.categories, format='%Y%m%d').to_numpy().astype('datetime64[s]')
+        # Per-row event counts fit in int32, halving the bytes every filter/groupby reads
+        counts = np.concatenate(count_pages)
+        if counts.max() <= np.iinfo(np.int32).max:
+            counts = counts.astype(np.int32)
+        df = pd.DataFrame({
+            'date': days[date_codes.codes],
+            'event_action': event_actions,
+            'campaign': campaigns,
+            'channel': channels,
+            'url': urls,
+            'count': counts,
+        })
+        # GA4 event labels can carry stray whitespace; strip once here so
+        # downstream lookups compare labels directly
+        df['event_action'] = df['event_action'].str.strip()
+        # Low-cardinality strings: categorical codes make groupby/isin integer operations
+        for col in ('event_action', 'campaign', 'channel', 'url'):
+            df[col] = df[col].astype('category')
+        # Keep rows in date order so date windows can be sliced by binary search
+        df = df.sort_values('date', kind='stable', ignore_index=True)
+
+    # Metadata for debugging
+    is_truncated = (
+        len(dates) >= GA4_ROW_LIMIT or
+        total_pages >= max_pages
+    )
+
+    metadata = {
+        'row_count': len(df),
+        'row_limit': GA4_ROW_LIMIT,
+        'is_truncated': is_truncated,
+        'pages_fetched': total_pages,
+        'date_range_start': start_date,
+        'date_range_end': end_date,
+        'timezone': GA4_TIMEZONE,
+        'query_time': datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S %Z"),
+        'channel_dimension': 'sessionSource',
+    }
+
+    return {'data': df, 'metadata': metadata}
 
-        # Extract unique channel values
-        channels = []
-        for row in response.rows:
-            channels.append({
-                'channel': row.dimension_values[0].value,
-                'total_count': int(row.metric_values[0].value)
-            })
 
-        return channels
+def get_data(
+    property_id: str = None,
+    credentials_path: str = None,
+    use_default_credentials: bool = True
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Get data from Google Analytics 4 API.
+    Returns tuple of (DataFrame, metadata dict).
+    """
+    if not property_id:
+        st.error("GA4 Property ID is required")
+        return pd.DataFrame(), {}
 
+    try:
+        if get_ga4_client(credentials_path, use_default_credentials) is None:
+            st.error("No credentials provided for GA4 API. Add 'gcp_service_account' to Streamlit secrets.")
+            return pd.DataFrame(), {}
+        result = load_ga4_data(property_id, credentials_path, use_default_credentials, get_refresh_window())
     except Exception as e:
-        st.error(f"Error getting channels: {str(e)}")
-        return []
+        st.error(f"Error loading GA4 data: {str(e)}")
+        return pd.DataFrame(), {'error': str(e)}
+    return result['data'], result['metadata']
 
 
-def get_unique_campaigns(df: pd.DataFrame) -> list:
-    """Get unique campaigns with event counts."""
+def get_unique_urls(df: pd.DataFrame) -> list:
+    """Get unique URLs with event counts."""
     if df.empty:
         return []
-    campaign_counts = df.groupby('campaign')['count'].sum().sort_values(ascending=False)
-    return [(camp, count) for camp, count in campaign_counts.items()]
+    url_counts = df.groupby('url', observed=True, sort=False)['count'].sum().sort_values(ascending=False)
+    return [(url, count) for url, count in url_counts.items()]
 
 
-def get_unique_channels(df: pd.DataFrame) -> list:
-    """Get unique channels with event counts."""
-    if df.empty:
-        return []
-    channel_counts = df.groupby('channel')['count'].sum().sort_values(ascending=False)
-    return [(channel, count) for channel, count in channel_counts.items()]
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def get_date_window_options(
+    _df: pd.DataFrame,
+    data_version: str,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp
+) -> tuple[list, list, list]:
+    """
+    Get campaigns, channels and URLs with event counts for a date window.
+    The DataFrame is not hashed (leading underscore); data_version identifies
+    the loaded dataset so the cache is invalidated when GA4 data is refreshed.
+    """
+    window_df = slice_date_range(_df, start_date, end_date)
+    if window_df.empty:
+        return [], [], []
 
+    # One pass over the rows into (campaign, channel, url) totals; each option
+    # list is then a small re-aggregation of that instead of a full-frame groupby
+    combo_counts = window_df.groupby(['campaign', 'channel', 'url'], observed=True, sort=False)['count'].sum()
 
-def get_unique_urls(df: pd.DataFrame) -> list:
-    """Get unique URLs with event counts."""
-    if df.empty:
-        return []
-    url_counts = df.groupby('url')['count'].sum().sort_values(ascending=False)
-    return [(url, count) for url, count in url_counts.items()]
+    def ranked(level: str) -> list:
+        counts = combo_counts.groupby(level=level, observed=True, sort=False).sum().sort_values(ascending=False)
+        return [(value, count) for value, count in counts.items()]
+
+    return ranked('campaign'), ranked('channel'), ranked('url')
+
+
+def slice_date_range(df: pd.DataFrame, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+    """
+    Select the rows between start_date and end_date (inclusive).
+    Relies on the loader keeping df sorted by date: two binary searches and a
+    positional slice instead of a full-column comparison.
+    """
+    dates = df['date'].to_numpy()
+    lo = dates.searchsorted(np.datetime64(start_date), side='left')
+    hi = dates.searchsorted(np.datetime64(end_date), side='right')
+    return df.iloc[lo:hi]
 
 
 def filter_data(
@@ -343,56 +311,109 @@ def filter_data(
     if df.empty:
         return df
 
-    filtered = df.copy()
+    # Date range is a slice of the date-sorted frame
+    df = slice_date_range(df, start_date, end_date)
 
-    # Date filter
-    filtered = filtered[(filtered['date'] >= start_date) & (filtered['date'] <= end_date)]
+    # Build one combined mask for the remaining filters and select once,
+    # instead of materializing an intermediate frame per filter
+    mask = None
 
     # Campaign filter
     if campaigns:
-        filtered = filtered[filtered['campaign'].isin(campaigns)]
+        mask = df['campaign'].isin(campaigns)
 
     # Channel filter
     if channels:
-        filtered = filtered[filtered['channel'].isin(channels)]
+        channel_mask = df['channel'].isin(channels)
+        mask = channel_mask if mask is None else mask & channel_mask
 
     # URL filter
     if urls:
-        filtered = filtered[filtered['url'].isin(urls)]
+        url_mask = df['url'].isin(urls)
+        mask = url_mask if mask is None else mask & url_mask
 
-    return filtered
+    return df if mask is None else df[mask]
 
 
-def aggregate_by_event_action(df: pd.DataFrame, url: str = None) -> pd.DataFrame:
-    """Aggregate data by event_action with cascade ratio, filtered by landing page."""
+def build_url_index(df: pd.DataFrame) -> dict:
+    """Map each URL to the positional row indices it occupies in df."""
     if df.empty:
-        return pd.DataFrame(columns=['event_action', 'total_count', 'ratio'])
+        return {}
+    return df.groupby('url', observed=True, sort=False).indices
 
-    # Filter by URL if provided
-    filtered_df = df.copy()
-    if url:
-        filtered_df = filtered_df[filtered_df['url'] == url]
 
-    result = filtered_df.groupby('event_action')['count'].sum().reset_index()
-    result.columns = ['event_action', 'total_count']
-    result = result.sort_values('total_count', ascending=False).reset_index(drop=True)
+def select_urls(df: pd.DataFrame, urls: list, url_index: dict) -> pd.DataFrame:
+    """
+    Select the rows of df belonging to the given URLs using a prebuilt URL index.
+    Only the selected rows are touched, instead of scanning the whole url column.
+    """
+    positions = [url_index[url] for url in urls if url in url_index]
+    if not positions:
+        return df.iloc[0:0]
+    return df.take(np.sort(np.concatenate(positions)))
 
+
+def aggregate_landing_comparison(
+    df: pd.DataFrame,
+    old_urls: list = None,
+    new_urls: list = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Aggregate OLD and NEW landing data by event_action in a single groupby.
+    Each row is tagged with the landing(s) it belongs to (an empty URL list means
+    all rows), so overlapping selections are aggregated once and shared.
+    """
+    if df.empty:
+        empty = pd.DataFrame(columns=['event_action', 'total_count', 'ratio'])
+        return empty, empty.copy()
+
+    # Landing group per row: bit 1 = OLD, bit 2 = NEW (3 = both, 0 = neither)
+    in_old = df['url'].isin(old_urls).to_numpy() if old_urls else np.ones(len(df), dtype=bool)
+    in_new = df['url'].isin(new_urls).to_numpy() if new_urls else np.ones(len(df), dtype=bool)
+    landing_group = in_old.astype(np.int8) | (in_new.astype(np.int8) << 1)
+
+    event_action = df['event_action']
+    if isinstance(event_action.dtype, pd.CategoricalDtype):
+        # Categorical: one bincount over (landing group, event code) pairs gives a
+        # 4 x n_events histogram; OLD is groups 1+3, NEW is groups 2+3
+        categories = event_action.cat.categories
+        n_events = len(categories)
+        codes = event_action.cat.codes.to_numpy()
+        valid = codes >= 0
+        keys = landing_group[valid].astype(np.int64) * n_events + codes[valid]
+        sums = np.bincount(keys, weights=df['count'].to_numpy()[valid], minlength=4 * n_events).reshape(4, n_events)
+        seen = np.bincount(keys, minlength=4 * n_events).reshape(4, n_events)
+
+        def landing_totals(rows: list) -> pd.Series:
+            observed = seen[rows].sum(axis=0) > 0
+            totals = sums[rows].sum(axis=0)[observed].astype(np.int64)
+            return pd.Series(totals, index=categories[observed])
+
+        old_totals = landing_totals([1, 3])
+        new_totals = landing_totals([2, 3])
+    else:
+        grouped = df.groupby([landing_group, event_action], observed=True, sort=False)['count'].sum()
+        groups = grouped.index.get_level_values(0)
+        old_totals = grouped[(groups & 1) != 0].groupby(level=1, observed=True, sort=False).sum()
+        new_totals = grouped[(groups & 2) != 0].groupby(level=1, observed=True, sort=False).sum()
+
+    return _build_event_action_table(old_totals), _build_event_action_table(new_totals)
+
+
+def _build_event_action_table(event_totals: pd.Series) -> pd.DataFrame:
+    """Build the event_action table (top 36 by count, with cascade ratio) from per-event totals."""
+    # Sort and trim the Series, then build the table once (no reset_index/rename copies)
     # Limit to first 36 events (include all, even with 0 count)
-    result = result.head(36).reset_index(drop=True)
-
-    # Calculate cascade ratio (current row / previous row)
-    ratios = []
-    for i in range(len(result)):
-        if i == 0:
-            ratios.append("100%")
-        else:
-            prev_count = result.iloc[i - 1]['total_count']
-            curr_count = result.iloc[i]['total_count']
-            if prev_count > 0:
-                ratio = (curr_count / prev_count) * 100
-                ratios.append(f"{ratio:.1f}%")
-            else:
-                ratios.append("N/A")
+    top_events = event_totals.sort_values(ascending=False).head(36)
+    result = pd.DataFrame({'event_action': top_events.index, 'total_count': top_events.to_numpy()})
+
+    # Calculate cascade ratio (current row / previous row), vectorized over the shifted counts
+    counts = result['total_count'].to_numpy(dtype=np.int64)
+    prev_counts = counts[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step_ratios = counts[1:] / prev_counts * 100
+    ratios = ["100%"] if len(counts) else []
+    ratios += [f"{ratio:.1f}%" if prev > 0 else "N/A" for ratio, prev in zip(step_ratios.tolist(), prev_counts.tolist())]
 
     result['ratio'] = ratios
     return result
@@ -1,16 +1,20 @@
 """Filter components for the Google Analytics Dashboard."""
+import numpy as np
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 
 
-def format_count(count: float) -> str:
-    """Format count with K/M suffix."""
-    if count >= 1_000_000:
-        return f"{count/1_000_000:.1f}M"
-    elif count >= 1_000:
-        return f"{count/1_000:.1f}K"
-    return str(int(count))
+def format_counts(counts) -> list:
+    """Format a sequence of counts with K/M suffix (e.g. 1.2K, 3.4M), scaling them in one pass."""
+    counts = np.asarray(counts, dtype=np.float64)
+    millions = counts >= 1_000_000
+    thousands = ~millions & (counts >= 1_000)
+    scaled = np.where(millions, counts / 1_000_000, np.where(thousands, counts / 1_000, counts))
+    return [
+        f"{value:.1f}M" if is_millions else f"{value:.1f}K" if is_thousands else str(int(value))
+        for value, is_millions, is_thousands in zip(scaled.tolist(), millions.tolist(), thousands.tolist())
+    ]
 
 
 def render_date_filter(df: pd.DataFrame) -> tuple:
@@ -51,10 +55,11 @@ def render_campaign_filter(campaigns_with_counts: list) -> list:
         st.sidebar.info("No campaigns available")
         return []
 
-    # Create options with counts
-    options = [f"{camp} - {format_count(count)} events"
-               for camp, count in campaigns_with_counts]
-    campaign_names = [camp for camp, _ in campaigns_with_counts]
+    # Create options with counts, mapped back to their campaign name
+    count_labels = format_counts([count for _, count in campaigns_with_counts])
+    option_to_campaign = {f"{camp} - {label} events": camp
+                          for (camp, _), label in zip(campaigns_with_counts, count_labels)}
+    options = list(option_to_campaign)
 
     selected_options = st.sidebar.multiselect(
         "Select Campaigns",
@@ -64,14 +69,7 @@ def render_campaign_filter(campaigns_with_counts: list) -> list:
     )
 
     # Extract campaign names from selected options
-    selected_campaigns = []
-    for opt in selected_options:
-        for camp, count in campaigns_with_counts:
-            if opt.startswith(camp):
-                selected_campaigns.append(camp)
-                break
-
-    return selected_campaigns
+    return [option_to_campaign[opt] for opt in selected_options if opt in option_to_campaign]
 
 
 def render_channel_filter(channels_with_counts: list) -> list:
@@ -82,9 +80,11 @@ def render_channel_filter(channels_with_counts: list) -> list:
         st.sidebar.info("No channels available")
         return []
 
-    # Create options with counts
-    options = [f"{channel} - {format_count(count)} events"
-               for channel, count in channels_with_counts]
+    # Create options with counts, mapped back to their channel name
+    count_labels = format_counts([count for _, count in channels_with_counts])
+    option_to_channel = {f"{channel} - {label} events": channel
+                         for (channel, _), label in zip(channels_with_counts, count_labels)}
+    options = list(option_to_channel)
 
     selected_options = st.sidebar.multiselect(
         "Select Channels",
@@ -94,13 +94,16 @@ def render_channel_filter(channels_with_counts: list) -> list:
     )
 
     # Extract channel names from selected options
-    selected_channels = []
-    for opt in selected_options:
-        for channel, count in channels_with_counts:
-            if opt.startswith(channel):
-                selected_channels.append(channel)
-                break
-
-    return selected_channels
-
-
+    return [option_to_channel[opt] for opt in selected_options if opt in option_to_channel]
+
+
+def match_url_options(url_options: tuple, url_options_lower: np.ndarray, search: str) -> tuple:
+    """
+    Return the URL options containing search (case-insensitive).
+    url_options_lower is the precomputed lowercase array of url_options, so the
+    match is a single vectorized pass instead of lowering every URL per keystroke.
+    """
+    if not search:
+        return url_options
+    mask = np.char.find(url_options_lower, search.lower()) >= 0
+    return tuple(url_options[i] for i in np.flatnonzero(mask))
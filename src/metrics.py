@@ -1,59 +1,75 @@
 """KPI and metric calculation functions for the Google Analytics Dashboard."""
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+# Funnel event actions used by the KPIs
+EVENT_SOURCE_COOKIE = "Enpal Source Cookie"
+EVENT_PRODUCT_BONUS = "Per quale prodotto vuoi scoprire i bonus?"
+EVENT_BUILDING_TYPE = "Per quale tipo di edificio vuoi scoprire i bonus?"
+EVENT_LEAD = "slider-success"
+KPI_EVENTS = (EVENT_SOURCE_COOKIE, EVENT_PRODUCT_BONUS, EVENT_BUILDING_TYPE, EVENT_LEAD)
 
-def calculate_ratio(df: pd.DataFrame, event1: str, event2: str) -> float:
-    """Calculate ratio between two event actions."""
-    if df.empty:
-        return 0.0
 
-    # Check if 'event_action' column exists
-    if 'event_action' not in df.columns:
-        return 0.0
+def get_event_totals(df: pd.DataFrame) -> pd.Series:
+    """Sum event counts per event_action in a single pass."""
+    if df.empty or 'event_action' not in df.columns:
+        return pd.Series(dtype='int64')
+
+    event_action = df['event_action']
+    if not isinstance(event_action.dtype, pd.CategoricalDtype):
+        return df.groupby(event_action)['count'].sum()
 
-    # Use str.strip() to match events ignoring leading/trailing whitespace
-    # Also use str.contains for partial matching to handle whitespace issues
-    event1_mask = df['event_action'].str.strip() == event1.strip()
-    event2_mask = df['event_action'].str.strip() == event2.strip()
-    
-    event1_count = df[event1_mask]['count'].sum()
-    event2_count = df[event2_mask]['count'].sum()
+    # Categorical: one bincount over the integer codes instead of hashing strings
+    codes = event_action.cat.codes.to_numpy()
+    counts = df['count'].to_numpy()
+    valid = codes >= 0
+    sums = np.bincount(codes[valid], weights=counts[valid], minlength=len(event_action.cat.categories))
+    return pd.Series(sums.astype(np.int64), index=event_action.cat.categories)
+
+
+def calculate_ratio(df: pd.DataFrame, event1: str, event2: str, event_totals: pd.Series = None) -> float:
+    """
+    Calculate ratio between two event actions.
+    Pass event_totals (from get_event_totals) to reuse one aggregation across several KPIs.
+    """
+    if event_totals is None:
+        event_totals = get_event_totals(df)
+
+    event1_count = event_totals.get(event1, 0)
+    event2_count = event_totals.get(event2, 0)
 
     if event2_count == 0:
         return 0.0
 
-    return (event1_count / event2_count) * 100
+    return float(event1_count / event2_count * 100)
 
 
-def calculate_leads(df: pd.DataFrame) -> int:
+def calculate_leads(df: pd.DataFrame, event_totals: pd.Series = None) -> int:
     """Calculate Leads: count of 'slider-success' events."""
-    if df.empty:
-        return 0
-    if 'event_action' in df.columns:
-        mask = df['event_action'].str.strip() == 'slider-success'
-        return int(df[mask]['count'].sum())
-    return 0
+    if event_totals is None:
+        event_totals = get_event_totals(df)
+    return int(event_totals.get(EVENT_LEAD, 0))
 
 
-def calculate_start_rate(df: pd.DataFrame) -> float:
+def calculate_start_rate(df: pd.DataFrame, event_totals: pd.Series = None) -> float:
     """Calculate Start Rate: 'Per quale prodotto vuoi scoprire i bonus?' / 'Enpal Source Cookie' * 100"""
-    return calculate_ratio(df, "Per quale prodotto vuoi scoprire i bonus?", "Enpal Source Cookie")
+    return calculate_ratio(df, EVENT_PRODUCT_BONUS, EVENT_SOURCE_COOKIE, event_totals)
 
 
-def calculate_end_rate(df: pd.DataFrame) -> float:
+def calculate_end_rate(df: pd.DataFrame, event_totals: pd.Series = None) -> float:
     """Calculate End Rate: 'slider-success' / 'Per quale prodotto vuoi scoprire i bonus?' * 100"""
-    return calculate_ratio(df, "slider-success", "Per quale prodotto vuoi scoprire i bonus?")
+    return calculate_ratio(df, EVENT_LEAD, EVENT_PRODUCT_BONUS, event_totals)
 
 
-def calculate_registration_rate(df: pd.DataFrame) -> float:
+def calculate_registration_rate(df: pd.DataFrame, event_totals: pd.Series = None) -> float:
     """Calculate Registration Rate: 'slider-success' / 'Enpal Source Cookie' * 100"""
-    return calculate_ratio(df, "slider-success", "Enpal Source Cookie")
+    return calculate_ratio(df, EVENT_LEAD, EVENT_SOURCE_COOKIE, event_totals)
 
 
-def calculate_cap_success(df: pd.DataFrame) -> float:
+def calculate_cap_success(df: pd.DataFrame, event_totals: pd.Series = None) -> float:
     """Calculate CAP Success: 'slider-success' / 'Per quale tipo di edificio vuoi scoprire i bonus?' * 100"""
-    return calculate_ratio(df, "slider-success", "Per quale tipo di edificio vuoi scoprire i bonus?")
+    return calculate_ratio(df, EVENT_LEAD, EVENT_BUILDING_TYPE, event_totals)
 
 
 def render_conversion_metrics(df: pd.DataFrame):
@@ -64,11 +80,12 @@ def render_conversion_metrics(df: pd.DataFrame):
         st.info("No data available for metrics")
         return
 
+    event_totals = get_event_totals(df)
     col1, col2 = st.columns(2)
 
     with col1:
         # Click to submit ratio
-        click_to_submit = calculate_ratio(df, 'form_submit', 'button_click')
+        click_to_submit = calculate_ratio(df, 'form_submit', 'button_click', event_totals)
         st.metric(
             label="Form Submit / Button Click",
             value=f"{click_to_submit:.2f}%"
@@ -76,7 +93,7 @@ def render_conversion_metrics(df: pd.DataFrame):
 
     with col2:
         # Page view to click ratio
-        view_to_click = calculate_ratio(df, 'button_click', 'page_view')
+        view_to_click = calculate_ratio(df, 'button_click', 'page_view', event_totals)
         st.metric(
             label="Button Click / Page View",
             value=f"{view_to_click:.2f}%"
@@ -3,12 +3,20 @@ Report Generator Module
 Generates cumulative PDF/HTML reports with executive summaries and charts.
 """
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
 from datetime import datetime
-import base64
 from typing import Optional
+from src.metrics import (
+    EVENT_BUILDING_TYPE,
+    EVENT_LEAD,
+    EVENT_PRODUCT_BONUS,
+    EVENT_SOURCE_COOKIE,
+    get_event_totals
+)
 
 
 # Funnel steps for drop-off analysis
@@ -24,6 +32,212 @@ FUNNEL_STEPS_ORDER = [
     ("slider-success", "Lead Completato")
 ]
 
+# Funnel events and labels split once at import; the event list is also every
+# event the report reads (the KPI events are a subset of the funnel)
+FUNNEL_STEP_NAMES = [event_name for event_name, _ in FUNNEL_STEPS_ORDER]
+FUNNEL_STEP_LABELS = [label for _, label in FUNNEL_STEPS_ORDER]
+
+
+# Static stylesheet for the HTML report (plain string, interpolated once per report)
+_REPORT_CSS = """
+        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
+
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+
+        body {
+            font-family: 'Inter', -apple-system, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            background: #f5f5f5;
+            padding: 30px;
+        }
+
+        .report { max-width: 900px; margin: 0 auto; }
+
+        .header {
+            background: linear-gradient(135deg, #191970 0%, #000080 100%);
+            color: white;
+            padding: 30px;
+            border-radius: 12px;
+            margin-bottom: 30px;
+            text-align: center;
+        }
+
+        .header h1 { font-size: 24px; margin-bottom: 5px; }
+        .header .meta { opacity: 0.8; font-size: 14px; }
+
+        .analysis {
+            background: white;
+            border-radius: 12px;
+            padding: 30px;
+            margin-bottom: 25px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.08);
+        }
+
+        .analysis-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            border-bottom: 2px solid #f0f0f0;
+            padding-bottom: 15px;
+            margin-bottom: 20px;
+        }
+
+        .analysis-title { font-size: 18px; font-weight: 600; color: #191970; }
+        .analysis-date { font-size: 13px; color: #888; }
+
+        .winner-box {
+            background: linear-gradient(135deg, #4ECDC4 0%, #44B3AA 100%);
+            color: white;
+            padding: 20px;
+            border-radius: 10px;
+            margin-bottom: 20px;
+            text-align: center;
+        }
+
+        .winner-box.old { background: linear-gradient(135deg, #FF6B35 0%, #E5552A 100%); }
+
+        .winner-label { font-size: 12px; text-transform: uppercase; opacity: 0.9; }
+        .winner-name { font-size: 22px; font-weight: 700; margin: 5px 0; }
+        .winner-reason { font-size: 14px; opacity: 0.9; }
+
+        .kpi-comparison {
+            display: grid;
+            grid-template-columns: 1fr 1fr;
+            gap: 15px;
+            margin: 20px 0;
+        }
+
+        .kpi-card {
+            padding: 15px;
+            border-radius: 8px;
+            border: 1px solid #e8e8e8;
+        }
+
+        .kpi-card.old { border-left: 4px solid #FF6B35; }
+        .kpi-card.new { border-left: 4px solid #4ECDC4; }
+
+        .kpi-card h4 {
+            font-size: 13px;
+            color: #666;
+            margin-bottom: 10px;
+            text-transform: uppercase;
+        }
+
+        .kpi-card .url-label {
+            font-size: 11px;
+            color: #333;
+            font-weight: 500;
+            word-break: break-all;
+            margin-bottom: 12px;
+            padding: 8px;
+            background: #f8f8f8;
+            border-radius: 4px;
+            text-transform: none;
+        }
+
+        .kpi-row {
+            display: flex;
+            justify-content: space-between;
+            padding: 6px 0;
+            font-size: 13px;
+        }
+
+        .kpi-value { font-weight: 600; }
+
+        .problems-section {
+            background: #FFF8E1;
+            border: 1px solid #FFE082;
+            border-radius: 8px;
+            padding: 20px;
+            margin: 20px 0;
+        }
+
+        .problems-section h4 {
+            color: #F57C00;
+            margin-bottom: 15px;
+            font-size: 14px;
+        }
+
+        .problem-item {
+            padding: 10px;
+            background: white;
+            border-radius: 6px;
+            margin-bottom: 10px;
+            border-left: 3px solid #FF9800;
+        }
+
+        .problem-step { font-weight: 600; color: #333; }
+        .problem-desc { font-size: 13px; color: #666; margin-top: 5px; }
+
+        .recommendation {
+            background: #E8F5E9;
+            border: 2px solid #4CAF50;
+            border-radius: 10px;
+            padding: 20px;
+            text-align: center;
+            margin-top: 20px;
+        }
+
+        .recommendation h4 {
+            color: #2E7D32;
+            font-size: 12px;
+            text-transform: uppercase;
+            margin-bottom: 8px;
+        }
+
+        .recommendation .action {
+            font-size: 20px;
+            font-weight: 700;
+            color: #1B5E20;
+        }
+
+        .motivo-section {
+            background: #E3F2FD;
+            border: 1px solid #90CAF9;
+            border-radius: 8px;
+            padding: 20px;
+            margin: 20px 0;
+        }
+
+        .motivo-section h4 {
+            color: #1565C0;
+            margin-bottom: 12px;
+            font-size: 14px;
+        }
+
+        .motivo-text {
+            font-size: 14px;
+            color: #333;
+            line-height: 1.7;
+        }
+
+        .motivo-text p {
+            margin-bottom: 10px;
+        }
+
+        .motivo-text p:last-child {
+            margin-bottom: 0;
+        }
+
+        .chart-container {
+            margin: 20px 0;
+            text-align: center;
+        }
+
+        .footer {
+            text-align: center;
+            padding: 20px;
+            color: #888;
+            font-size: 12px;
+        }
+
+        @media print {
+            body { padding: 10px; background: white; }
+            .analysis { page-break-inside: avoid; box-shadow: none; border: 1px solid #ddd; }
+        }
+    """
+
 
 def init_report_session():
     """Initialize session state for cumulative reports."""
@@ -39,78 +253,114 @@ def clear_report():
     st.session_state.report_created_at = datetime.now().strftime("%Y-%m-%d %H:%M")
 
 
-def fig_to_base64(fig: go.Figure, width: int = 800, height: int = 400) -> str:
-    """Convert Plotly figure to base64 encoded PNG image."""
-    try:
-        img_bytes = pio.to_image(fig, format="png", width=width, height=height)
-        return base64.b64encode(img_bytes).decode()
-    except Exception:
+def fig_to_html_div(fig: go.Figure, div_id: Optional[str] = None) -> str:
+    """Serialize Plotly figure to an embeddable <div> (plotly.js is loaded once by the report)."""
+    return pio.to_html(fig, include_plotlyjs=False, full_html=False, div_id=div_id)
+
+
+def plotlyjs_script_tag() -> str:
+    """CDN <script> tag for the plotly.js build matching the installed plotly package."""
+    return f'<script charset="utf-8" src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>'
+
+
+def _events_dict(df: pd.DataFrame) -> dict:
+    """Totals for the report events."""
+    # Single bincount over the event codes, then a lookup of the handful of events we read
+    totals = get_event_totals(df).reindex(FUNNEL_STEP_NAMES, fill_value=0)
+    return dict(zip(FUNNEL_STEP_NAMES, totals.tolist()))
+
+
+def _safe_events(df: pd.DataFrame) -> Optional[dict]:
+    """Report event totals, or None when the frame has no event data."""
+    if df.empty or 'event_action' not in df.columns:
         return None
+    return _events_dict(df)
+
+
+def _compute_kpis(df: pd.DataFrame) -> dict:
+    """Raw (unrounded) landing KPIs, shared by the executive summary and the KPI chart."""
+    events = _safe_events(df)
+    if events is None:
+        return {'leads': 0, 'start_rate': 0, 'end_rate': 0, 'cap_success': 0, 'reg_rate': 0, 'volume': 0}
+
+    enpal = events.get(EVENT_SOURCE_COOKIE, 0)
+    bonus = events.get(EVENT_PRODUCT_BONUS, 0)
+    building = events.get(EVENT_BUILDING_TYPE, 0)
+    leads = events.get(EVENT_LEAD, 0)
+
+    return {
+        'leads': leads,
+        'start_rate': (bonus / enpal * 100) if enpal > 0 else 0,
+        'end_rate': (leads / bonus * 100) if bonus > 0 else 0,
+        'cap_success': (leads / building * 100) if building > 0 else 0,
+        'reg_rate': (leads / enpal * 100) if enpal > 0 else 0,
+        'volume': enpal
+    }
 
 
 def calculate_funnel_metrics(df: pd.DataFrame) -> dict:
     """Calculate detailed funnel metrics including drop-offs."""
-    if df.empty or 'event_action' not in df.columns:
+    events = _safe_events(df)
+    if events is None:
         return {}
 
-    events = df.groupby('event_action')['count'].sum().to_dict()
-
-    funnel_data = []
-    prev_count = None
-
-    for event_name, label in FUNNEL_STEPS_ORDER:
-        count = events.get(event_name, 0)
-        if count == 0:
-            # Try with stripped whitespace
-            for e, c in events.items():
-                if e.strip() == event_name.strip():
-                    count = c
-                    break
-
-        if count > 0 or prev_count is not None:
-            drop_off = 0
-            drop_off_pct = 0
-            if prev_count and prev_count > 0:
-                drop_off = prev_count - count
-                drop_off_pct = (drop_off / prev_count) * 100
-
-            funnel_data.append({
-                'step': label,
-                'event': event_name,
-                'count': count,
-                'drop_off': drop_off,
-                'drop_off_pct': drop_off_pct
-            })
-            prev_count = count
-
-    return funnel_data
+    # The funnel starts at the first step with any events and runs to the end
+    counts = np.array([events[event_name] for event_name in FUNNEL_STEP_NAMES], dtype=np.int64)
+    reached = np.flatnonzero(counts)
+    if not reached.size:
+        return []
+    first = reached[0]
+    counts = counts[first:]
+
+    # Drop-off against the previous step (none for the first step or after an empty step)
+    prev_counts = np.concatenate(([0], counts[:-1]))
+    has_prev = prev_counts > 0
+    drop_off = np.where(has_prev, prev_counts - counts, 0)
+    drop_off_pct = np.divide(drop_off, prev_counts, out=np.zeros(len(counts)), where=has_prev) * 100
+
+    return [
+        {
+            'step': label,
+            'event': event_name,
+            'count': count,
+            'drop_off': step_drop_off,
+            'drop_off_pct': step_drop_off_pct
+        }
+        for label, event_name, count, step_drop_off, step_drop_off_pct in zip(
+            FUNNEL_STEP_LABELS[first:], FUNNEL_STEP_NAMES[first:],
+            counts.tolist(), drop_off.tolist(), drop_off_pct.tolist()
+        )
+    ]
 
 
 def identify_critical_steps(old_funnel: list, new_funnel: list) -> list:
     """Identify the top 3 critical steps where most users are lost."""
-    critical_steps = []
-
-    # Combine data for comparison
-    old_dict = {f['step']: f for f in old_funnel}
+    # Steps present in both funnels (in OLD funnel order), Entry Point excluded
     new_dict = {f['step']: f for f in new_funnel}
+    pairs = [
+        (f, new_dict[f['step']]) for f in old_funnel
+        if f['step'] in new_dict and f['step'] != "Entry Point"
+    ]
+    if not pairs:
+        return []
+
+    # Rank by severity (highest drop-off first); stable so ties keep funnel order
+    old_drop = np.array([o['drop_off_pct'] for o, _ in pairs], dtype=float)
+    new_drop = np.array([n['drop_off_pct'] for _, n in pairs], dtype=float)
+    top = np.argsort(-np.maximum(old_drop, new_drop), kind='stable')[:3]
 
-    for step in old_dict:
-        if step in new_dict and step != "Entry Point":
-            old_drop = old_dict[step]['drop_off_pct']
-            new_drop = new_dict[step]['drop_off_pct']
-
-            critical_steps.append({
-                'step': step,
-                'old_drop_off': old_drop,
-                'new_drop_off': new_drop,
-                'difference': old_drop - new_drop,  # Positive = OLD worse
-                'severity': max(old_drop, new_drop)
-            })
-
-    # Sort by severity (highest drop-off first)
-    critical_steps.sort(key=lambda x: x['severity'], reverse=True)
+    critical_steps = []
+    for i in top:
+        old_step, new_step = pairs[i]
+        critical_steps.append({
+            'step': old_step['step'],
+            'old_drop_off': old_step['drop_off_pct'],
+            'new_drop_off': new_step['drop_off_pct'],
+            'difference': old_step['drop_off_pct'] - new_step['drop_off_pct'],  # Positive = OLD worse
+            'severity': max(old_step['drop_off_pct'], new_step['drop_off_pct'])
+        })
 
-    return critical_steps[:3]
+    return critical_steps
 
 
 def generate_executive_summary(
@@ -118,7 +368,9 @@ def generate_executive_summary(
     new_df: pd.DataFrame,
     old_name: str,
     new_name: str,
-    date_range: str
+    date_range: str,
+    old_kpis: Optional[dict] = None,
+    new_kpis: Optional[dict] = None
 ) -> dict:
     """
     Generate a clear executive summary with:
@@ -126,30 +378,16 @@ def generate_executive_summary(
     - Key metrics comparison
     - Critical funnel steps
     - Final recommendation
-    """
 
-    # Calculate KPIs
-    def calc_kpis(df):
-        if df.empty or 'event_action' not in df.columns:
-            return {'leads': 0, 'start_rate': 0, 'end_rate': 0, 'cap_success': 0, 'reg_rate': 0, 'volume': 0}
+    Pass old_kpis/new_kpis (from _compute_kpis) to reuse KPIs already computed by the caller.
+    """
 
-        events = df.groupby('event_action')['count'].sum().to_dict()
-        enpal = events.get('Enpal Source Cookie', 0)
-        bonus = events.get('Per quale prodotto vuoi scoprire i bonus?', 0)
-        building = events.get('Per quale tipo di edificio vuoi scoprire i bonus?', 0)
-        leads = events.get('slider-success', 0)
+    # Calculate KPIs (rates rounded for display)
+    def round_kpis(kpis):
+        return {k: v if k in ('leads', 'volume') else round(v, 2) for k, v in kpis.items()}
 
-        return {
-            'leads': leads,
-            'start_rate': round((bonus / enpal * 100), 2) if enpal > 0 else 0,
-            'end_rate': round((leads / bonus * 100), 2) if bonus > 0 else 0,
-            'cap_success': round((leads / building * 100), 2) if building > 0 else 0,
-            'reg_rate': round((leads / enpal * 100), 2) if enpal > 0 else 0,
-            'volume': enpal
-        }
-
-    old_kpis = calc_kpis(old_df)
-    new_kpis = calc_kpis(new_df)
+    old_kpis = round_kpis(old_kpis if old_kpis is not None else _compute_kpis(old_df))
+    new_kpis = round_kpis(new_kpis if new_kpis is not None else _compute_kpis(new_df))
 
     # Calculate funnel metrics
     old_funnel = calculate_funnel_metrics(old_df)
@@ -297,28 +535,19 @@ def generate_executive_summary(
     }
 
 
-def create_kpi_comparison_fig(old_df: pd.DataFrame, new_df: pd.DataFrame) -> go.Figure:
-    """Create KPI comparison bar chart figure."""
-    def calc_kpis(df):
-        if df.empty or 'event_action' not in df.columns:
-            return {'Leads': 0, 'Start Rate': 0, 'End Rate': 0, 'CAP Success': 0, 'Reg Rate': 0}
-
-        events = df.groupby('event_action')['count'].sum().to_dict()
-        enpal = events.get('Enpal Source Cookie', 0)
-        bonus = events.get('Per quale prodotto vuoi scoprire i bonus?', 0)
-        building = events.get('Per quale tipo di edificio vuoi scoprire i bonus?', 0)
-        leads = events.get('slider-success', 0)
-
+def create_kpi_comparison_fig(old_kpis: dict, new_kpis: dict) -> go.Figure:
+    """Create KPI comparison bar chart figure from precomputed KPIs (see _compute_kpis)."""
+    def chart_kpis(kpis):
         return {
-            'Leads': leads,
-            'Start Rate': (bonus / enpal * 100) if enpal > 0 else 0,
-            'End Rate': (leads / bonus * 100) if bonus > 0 else 0,
-            'CAP Success': (leads / building * 100) if building > 0 else 0,
-            'Reg Rate': (leads / enpal * 100) if enpal > 0 else 0,
+            'Leads': kpis['leads'],
+            'Start Rate': kpis['start_rate'],
+            'End Rate': kpis['end_rate'],
+            'CAP Success': kpis['cap_success'],
+            'Reg Rate': kpis['reg_rate'],
         }
 
-    old_kpis = calc_kpis(old_df)
-    new_kpis = calc_kpis(new_df)
+    old_kpis = chart_kpis(old_kpis)
+    new_kpis = chart_kpis(new_kpis)
     kpi_names = list(old_kpis.keys())
 
     fig = go.Figure()
@@ -347,6 +576,11 @@ def create_kpi_comparison_fig(old_df: pd.DataFrame, new_df: pd.DataFrame) -> go.
     return fig
 
 
+def _kpi_chart_html(old_kpis: dict, new_kpis: dict, div_id: str) -> str:
+    """KPI chart <div> rebuilt from an analysis' stored KPIs."""
+    return fig_to_html_div(create_kpi_comparison_fig(old_kpis, new_kpis), div_id=div_id)
+
+
 def add_analysis_to_report(
     analysis_name: str,
     date_range: str,
@@ -359,17 +593,19 @@ def add_analysis_to_report(
     """Add a new analysis to the cumulative report with executive summary."""
     init_report_session()
 
+    # KPIs once per side, shared by the summary and the chart
+    old_kpis = _compute_kpis(old_df)
+    new_kpis = _compute_kpis(new_df)
+
     # Generate executive summary
     summary = generate_executive_summary(
         old_df, new_df,
         old_landing_name, new_landing_name,
-        date_range
+        date_range,
+        old_kpis=old_kpis,
+        new_kpis=new_kpis
     )
 
-    # Generate chart
-    kpi_chart = create_kpi_comparison_fig(old_df, new_df)
-    kpi_chart_b64 = fig_to_base64(kpi_chart) if kpi_chart else None
-
     analysis_entry = {
         'id': len(st.session_state.report_analyses) + 1,
         'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -377,7 +613,8 @@ def add_analysis_to_report(
         'date_range': date_range,
         'summary': summary,
         'filters': filters_applied or {},
-        'chart': kpi_chart_b64
+        # Only the raw KPIs are kept; the chart is rebuilt from them when the report is generated
+        'kpis': {'old': old_kpis, 'new': new_kpis}
     }
 
     st.session_state.report_analyses.append(analysis_entry)
@@ -391,215 +628,14 @@ def generate_html_report() -> str:
     if not st.session_state.report_analyses:
         return "<html><body><h1>No analyses to report</h1></body></html>"
 
-    html_content = f"""
+    parts = [f"""
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <title>Landing Page Analysis Report</title>
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-
-        body {{
-            font-family: 'Inter', -apple-system, sans-serif;
-            line-height: 1.6;
-            color: #333;
-            background: #f5f5f5;
-            padding: 30px;
-        }}
-
-        .report {{ max-width: 900px; margin: 0 auto; }}
-
-        .header {{
-            background: linear-gradient(135deg, #191970 0%, #000080 100%);
-            color: white;
-            padding: 30px;
-            border-radius: 12px;
-            margin-bottom: 30px;
-            text-align: center;
-        }}
-
-        .header h1 {{ font-size: 24px; margin-bottom: 5px; }}
-        .header .meta {{ opacity: 0.8; font-size: 14px; }}
-
-        .analysis {{
-            background: white;
-            border-radius: 12px;
-            padding: 30px;
-            margin-bottom: 25px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.08);
-        }}
-
-        .analysis-header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            border-bottom: 2px solid #f0f0f0;
-            padding-bottom: 15px;
-            margin-bottom: 20px;
-        }}
-
-        .analysis-title {{ font-size: 18px; font-weight: 600; color: #191970; }}
-        .analysis-date {{ font-size: 13px; color: #888; }}
-
-        .winner-box {{
-            background: linear-gradient(135deg, #4ECDC4 0%, #44B3AA 100%);
-            color: white;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 20px;
-            text-align: center;
-        }}
-
-        .winner-box.old {{ background: linear-gradient(135deg, #FF6B35 0%, #E5552A 100%); }}
-
-        .winner-label {{ font-size: 12px; text-transform: uppercase; opacity: 0.9; }}
-        .winner-name {{ font-size: 22px; font-weight: 700; margin: 5px 0; }}
-        .winner-reason {{ font-size: 14px; opacity: 0.9; }}
-
-        .kpi-comparison {{
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 15px;
-            margin: 20px 0;
-        }}
-
-        .kpi-card {{
-            padding: 15px;
-            border-radius: 8px;
-            border: 1px solid #e8e8e8;
-        }}
-
-        .kpi-card.old {{ border-left: 4px solid #FF6B35; }}
-        .kpi-card.new {{ border-left: 4px solid #4ECDC4; }}
-
-        .kpi-card h4 {{
-            font-size: 13px;
-            color: #666;
-            margin-bottom: 10px;
-            text-transform: uppercase;
-        }}
-
-        .kpi-card .url-label {{
-            font-size: 11px;
-            color: #333;
-            font-weight: 500;
-            word-break: break-all;
-            margin-bottom: 12px;
-            padding: 8px;
-            background: #f8f8f8;
-            border-radius: 4px;
-            text-transform: none;
-        }}
-
-        .kpi-row {{
-            display: flex;
-            justify-content: space-between;
-            padding: 6px 0;
-            font-size: 13px;
-        }}
-
-        .kpi-value {{ font-weight: 600; }}
-
-        .problems-section {{
-            background: #FFF8E1;
-            border: 1px solid #FFE082;
-            border-radius: 8px;
-            padding: 20px;
-            margin: 20px 0;
-        }}
-
-        .problems-section h4 {{
-            color: #F57C00;
-            margin-bottom: 15px;
-            font-size: 14px;
-        }}
-
-        .problem-item {{
-            padding: 10px;
-            background: white;
-            border-radius: 6px;
-            margin-bottom: 10px;
-            border-left: 3px solid #FF9800;
-        }}
-
-        .problem-step {{ font-weight: 600; color: #333; }}
-        .problem-desc {{ font-size: 13px; color: #666; margin-top: 5px; }}
-
-        .recommendation {{
-            background: #E8F5E9;
-            border: 2px solid #4CAF50;
-            border-radius: 10px;
-            padding: 20px;
-            text-align: center;
-            margin-top: 20px;
-        }}
-
-        .recommendation h4 {{
-            color: #2E7D32;
-            font-size: 12px;
-            text-transform: uppercase;
-            margin-bottom: 8px;
-        }}
-
-        .recommendation .action {{
-            font-size: 20px;
-            font-weight: 700;
-            color: #1B5E20;
-        }}
-
-        .motivo-section {{
-            background: #E3F2FD;
-            border: 1px solid #90CAF9;
-            border-radius: 8px;
-            padding: 20px;
-            margin: 20px 0;
-        }}
-
-        .motivo-section h4 {{
-            color: #1565C0;
-            margin-bottom: 12px;
-            font-size: 14px;
-        }}
-
-        .motivo-text {{
-            font-size: 14px;
-            color: #333;
-            line-height: 1.7;
-        }}
-
-        .motivo-text p {{
-            margin-bottom: 10px;
-        }}
-
-        .motivo-text p:last-child {{
-            margin-bottom: 0;
-        }}
-
-        .chart-container {{
-            margin: 20px 0;
-            text-align: center;
-        }}
-
-        .chart-container img {{
-            max-width: 100%;
-            border-radius: 8px;
-        }}
-
-        .footer {{
-            text-align: center;
-            padding: 20px;
-            color: #888;
-            font-size: 12px;
-        }}
-
-        @media print {{
-            body {{ padding: 10px; background: white; }}
-            .analysis {{ page-break-inside: avoid; box-shadow: none; border: 1px solid #ddd; }}
-        }}
-    </style>
+    <style>{_REPORT_CSS}</style>
+    {plotlyjs_script_tag() if any(a.get('kpis') for a in st.session_state.report_analyses) else ""}
 </head>
 <body>
     <div class="report">
@@ -607,13 +643,13 @@ def generate_html_report() -> str:
             <h1>Landing Page Analysis Report</h1>
             <p class="meta">Generato: {datetime.now().strftime("%d/%m/%Y %H:%M")} | Analisi: {len(st.session_state.report_analyses)}</p>
         </div>
-"""
+"""]
 
     for analysis in st.session_state.report_analyses:
         s = analysis['summary']
         winner_class = "old" if s['winner'] == "OLD" else ""
 
-        html_content += f"""
+        parts.append(f"""
         <div class="analysis">
             <div class="analysis-header">
                 <span class="analysis-title">#{analysis['id']} - {analysis['analysis_name']}</span>
@@ -654,52 +690,53 @@ def generate_html_report() -> str:
                     {f"<p>{s['funnel_explanation']}</p>" if s['funnel_explanation'] else ""}
                 </div>
             </div>
-"""
+""")
 
         # Add problems section
         if s['problems']:
-            html_content += """
+            parts.append("""
             <div class="problems-section">
                 <h4>Step Critici del Funnel (Dove si perdono utenti)</h4>
-"""
+""")
             for p in s['problems']:
-                html_content += f"""
+                parts.append(f"""
                 <div class="problem-item">
                     <div class="problem-step">{p['step']}</div>
                     <div class="problem-desc">{p['issue']}</div>
                 </div>
-"""
-            html_content += "</div>"
+""")
+            parts.append("</div>")
 
         # Add chart if available
-        if analysis.get('chart'):
-            html_content += f"""
+        if analysis.get('kpis'):
+            parts.append(f"""
             <div class="chart-container">
-                <img src="data:image/png;base64,{analysis['chart']}" alt="KPI Chart">
+                {_kpi_chart_html(analysis['kpis']['old'], analysis['kpis']['new'], f"kpi-chart-{analysis['id']}")}
             </div>
-"""
+""")
 
         # Add recommendation
-        html_content += f"""
+        parts.append(f"""
             <div class="recommendation">
                 <h4>Raccomandazione Finale</h4>
                 <div class="action">{s['recommendation']}</div>
             </div>
         </div>
-"""
+""")
 
-    html_content += """
+    parts.append("""
         <div class="footer">
             <p>Enpal Landing Page Analytics | Report automatico</p>
         </div>
     </div>
 </body>
 </html>
-"""
+""")
 
-    return html_content
+    return "".join(parts)
 
 
+@st.fragment
 def render_report_section(
     old_df: pd.DataFrame,
     new_df: pd.DataFrame,
@@ -709,7 +746,11 @@ def render_report_section(
     filters: dict,
     ai_analysis: Optional[str] = None
 ):
-    """Render the report generation UI section."""
+    """
+    Render the report generation UI section.
+    Runs as a fragment so typing a name or downloading only reruns this section;
+    adding or clearing analyses still triggers a full rerun.
+    """
     init_report_session()
 
     st.markdown("---")
@@ -737,7 +778,7 @@ def render_report_section(
     col_btn1, col_btn2, col_btn3 = st.columns(3)
 
     with col_btn1:
-        if st.button("Aggiungi al Report", type="primary", use_container_width=True):
+        if st.button("Aggiungi al Report", type="primary", width="stretch"):
             count = add_analysis_to_report(
                 analysis_name=analysis_name,
                 date_range=date_range,
@@ -758,12 +799,12 @@ def render_report_section(
                 data=html_report,
                 file_name=f"landing_report_{datetime.now().strftime('%Y%m%d_%H%M')}.html",
                 mime="text/html",
-                use_container_width=True
+                width="stretch"
             )
 
     with col_btn3:
         if st.session_state.report_analyses:
-            if st.button("Cancella", use_container_width=True):
+            if st.button("Cancella", width="stretch"):
                 clear_report()
                 st.info("Report cancellato!")
                 st.rerun()
@@ -1,8 +1,9 @@
 """Visualization functions for the Google Analytics Dashboard."""
-import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 import streamlit as st
+from src.metrics import KPI_EVENTS
 
 # Funnel steps configuration
 FUNNEL_STEPS = [
@@ -19,10 +20,44 @@ FUNNEL_LABELS = [
     "Lead (Success)"
 ]
 
+# Shared chart styling (plotly copies these into each figure, so sharing is safe)
+OLD_COLOR = '#FF6B35'
+NEW_COLOR = '#4ECDC4'
+LEGEND_TOP = dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
 
-def get_kpi_data(df: pd.DataFrame) -> dict:
-    """Extract KPI values from dataframe."""
+# Shared st.plotly_chart options (static comparison charts: no mode bar to build per render)
+_PLOTLY_KW = dict(width="stretch", config={'displayModeBar': False, 'responsive': True})
+
+
+def get_landing_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Event counts per (date, event_action) as a small dates x events table.
+    Every comparison chart derives its totals from this instead of re-scanning the rows.
+    """
     if df.empty or 'event_action' not in df.columns:
+        return pd.DataFrame(dtype='int64')
+
+    event_action = df['event_action']
+    if not isinstance(event_action.dtype, pd.CategoricalDtype):
+        return df.groupby(['date', 'event_action'])['count'].sum().unstack(fill_value=0)
+
+    # Categorical: one bincount over (day, event code) pairs
+    day_codes, days = pd.factorize(df['date'], sort=True)
+    events = event_action.cat.categories
+    codes = event_action.cat.codes.to_numpy()
+    valid = codes >= 0
+    keys = day_codes[valid].astype(np.int64) * len(events) + codes[valid]
+    sums = np.bincount(keys, weights=df['count'].to_numpy()[valid], minlength=len(days) * len(events))
+    return pd.DataFrame(
+        sums.astype(np.int64).reshape(len(days), len(events)),
+        index=pd.Index(days, name='date'),
+        columns=events
+    )
+
+
+def get_kpi_data(event_totals: pd.Series) -> dict:
+    """Extract KPI values from per-event totals."""
+    if event_totals.empty:
         return {
             'Leads': 0,
             'Start Rate': 0,
@@ -31,11 +66,8 @@ def get_kpi_data(df: pd.DataFrame) -> dict:
             'PostCap': 0
         }
 
-    events = df.groupby('event_action')['count'].sum().to_dict()
-    enpal = events.get('Enpal Source Cookie', 0)
-    bonus = events.get('Per quale prodotto vuoi scoprire i bonus?', 0)
-    building = events.get('Per quale tipo di edificio vuoi scoprire i bonus?', 0)
-    leads = events.get('slider-success', 0)
+    # Lookup of the four KPI events
+    enpal, bonus, building, leads = event_totals.reindex(KPI_EVENTS, fill_value=0).tolist()
 
     return {
         'Leads': leads,
@@ -46,130 +78,126 @@ def get_kpi_data(df: pd.DataFrame) -> dict:
     }
 
 
-def get_funnel_data(df: pd.DataFrame) -> dict:
-    """Extract funnel step counts from dataframe."""
-    if df.empty or 'event_action' not in df.columns:
+def get_funnel_data(event_totals: pd.Series) -> dict:
+    """Extract funnel step counts from per-event totals."""
+    if event_totals.empty:
         return {}
 
-    event_counts = df.groupby('event_action')['count'].sum().to_dict()
+    step_counts = event_totals.reindex(FUNNEL_STEPS, fill_value=0).tolist()
+    return dict(zip(FUNNEL_LABELS, step_counts))
 
-    funnel_data = {}
-    for step, label in zip(FUNNEL_STEPS, FUNNEL_LABELS):
-        count = event_counts.get(step, 0)
-        if count == 0:
-            for event, cnt in event_counts.items():
-                if event.strip() == step.strip():
-                    count = cnt
-                    break
-        funnel_data[label] = count
 
-    return funnel_data
+def _kpi_labels(kpis: dict) -> list:
+    """Bar labels: Leads as a count with thousands separators, rates with one decimal."""
+    return [f"{int(v):,}" if name == 'Leads' or v >= 1000 else f"{v:.1f}" for name, v in kpis.items()]
 
 
 # =============================================================================
 # 1. KPI COMPARISON BAR CHART
 # =============================================================================
-def render_kpi_comparison_chart(old_df: pd.DataFrame, new_df: pd.DataFrame):
-    """Bar chart comparing KPIs between Old and New landing pages."""
-    old_kpis = get_kpi_data(old_df)
-    new_kpis = get_kpi_data(new_df)
+def build_kpi_comparison_fig(old_events: pd.Series, new_events: pd.Series) -> go.Figure:
+    """Bar chart figure comparing KPIs between Old and New landing pages."""
+    old_kpis = get_kpi_data(old_events)
+    new_kpis = get_kpi_data(new_events)
 
     kpi_names = list(old_kpis.keys())
 
-    fig = go.Figure()
-
-    # OLD bars
-    fig.add_trace(go.Bar(
-        name='OLD Landing',
-        x=kpi_names,
-        y=list(old_kpis.values()),
-        marker_color='#FF6B35',
-        text=[f"{v:.1f}" if isinstance(v, float) and v < 1000 else f"{int(v):,}" for v in old_kpis.values()],
-        textposition='outside'
-    ))
-
-    # NEW bars
-    fig.add_trace(go.Bar(
-        name='NEW Landing',
-        x=kpi_names,
-        y=list(new_kpis.values()),
-        marker_color='#4ECDC4',
-        text=[f"{v:.1f}" if isinstance(v, float) and v < 1000 else f"{int(v):,}" for v in new_kpis.values()],
-        textposition='outside'
-    ))
-
-    fig.update_layout(
-        barmode='group',
-        title='KPI Comparison: OLD vs NEW Landing',
-        xaxis_title='KPI',
-        yaxis_title='Value',
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-        height=400
+    # Traces and layout go through one constructor call instead of add_trace/update_layout
+    return go.Figure(
+        data=[
+            # OLD bars
+            go.Bar(
+                name='OLD Landing',
+                x=kpi_names,
+                y=list(old_kpis.values()),
+                marker_color=OLD_COLOR,
+                text=_kpi_labels(old_kpis),
+                textposition='outside'
+            ),
+            # NEW bars
+            go.Bar(
+                name='NEW Landing',
+                x=kpi_names,
+                y=list(new_kpis.values()),
+                marker_color=NEW_COLOR,
+                text=_kpi_labels(new_kpis),
+                textposition='outside'
+            )
+        ],
+        layout=go.Layout(
+            barmode='group',
+            title='KPI Comparison: OLD vs NEW Landing',
+            xaxis_title='KPI',
+            yaxis_title='Value',
+            legend=LEGEND_TOP,
+            height=400
+        )
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+
+def render_kpi_comparison_chart(old_events: pd.Series, new_events: pd.Series):
+    """Bar chart comparing KPIs between Old and New landing pages."""
+    st.plotly_chart(build_kpi_comparison_fig(old_events, new_events), **_PLOTLY_KW)
 
 
 # =============================================================================
 # 2. DAILY TREND LINE CHART (Old vs New)
 # =============================================================================
-def render_trend_comparison_chart(old_df: pd.DataFrame, new_df: pd.DataFrame):
-    """Line chart showing daily trends for Old vs New landing pages."""
-    if old_df.empty and new_df.empty:
-        st.info("No data available for trend chart")
-        return
-
-    fig = go.Figure()
+def build_trend_comparison_fig(old_daily: pd.Series, new_daily: pd.Series) -> go.Figure:
+    """Line chart figure of daily trends for Old vs New landing pages."""
+    # WebGL traces: render cost stays flat as the date range (point count) grows
+    traces = []
 
     # OLD trend
-    if not old_df.empty:
-        old_daily = old_df.groupby('date')['count'].sum().reset_index()
-        old_daily = old_daily.sort_values('date')
-        fig.add_trace(go.Scatter(
-            x=old_daily['date'],
-            y=old_daily['count'],
+    if not old_daily.empty:
+        traces.append(go.Scattergl(
+            x=old_daily.index,
+            y=old_daily.values,
             mode='lines+markers',
             name='OLD Landing',
-            line=dict(color='#FF6B35', width=2),
+            line=dict(color=OLD_COLOR, width=2),
             marker=dict(size=6)
         ))
 
     # NEW trend
-    if not new_df.empty:
-        new_daily = new_df.groupby('date')['count'].sum().reset_index()
-        new_daily = new_daily.sort_values('date')
-        fig.add_trace(go.Scatter(
-            x=new_daily['date'],
-            y=new_daily['count'],
+    if not new_daily.empty:
+        traces.append(go.Scattergl(
+            x=new_daily.index,
+            y=new_daily.values,
             mode='lines+markers',
             name='NEW Landing',
-            line=dict(color='#4ECDC4', width=2),
+            line=dict(color=NEW_COLOR, width=2),
             marker=dict(size=6)
         ))
 
-    fig.update_layout(
-        title='Daily Trend: OLD vs NEW Landing',
-        xaxis_title='Date',
-        yaxis_title='Event Count',
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-        height=400,
-        hovermode='x unified'
+    return go.Figure(
+        data=traces,
+        layout=go.Layout(
+            title='Daily Trend: OLD vs NEW Landing',
+            xaxis_title='Date',
+            yaxis_title='Event Count',
+            legend=LEGEND_TOP,
+            height=400,
+            hovermode='x unified'
+        )
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+
+def render_trend_comparison_chart(old_daily: pd.Series, new_daily: pd.Series):
+    """Line chart showing daily trends for Old vs New landing pages."""
+    st.plotly_chart(build_trend_comparison_fig(old_daily, new_daily), **_PLOTLY_KW)
 
 
 # =============================================================================
 # 3. DROP-OFF CHART (Step-to-step retention)
 # =============================================================================
-def render_dropoff_chart(old_df: pd.DataFrame, new_df: pd.DataFrame):
-    """Line chart showing % retention through funnel steps."""
-    old_funnel = get_funnel_data(old_df)
-    new_funnel = get_funnel_data(new_df)
+def build_dropoff_fig(old_events: pd.Series, new_events: pd.Series):
+    """Line chart figure of % retention through funnel steps (None without funnel data)."""
+    old_funnel = get_funnel_data(old_events)
+    new_funnel = get_funnel_data(new_events)
 
     if not old_funnel and not new_funnel:
-        st.info("No funnel data available")
-        return
+        return None
 
     # Calculate retention percentages
     old_start = old_funnel.get('Start', 1) or 1
@@ -178,115 +206,108 @@ def render_dropoff_chart(old_df: pd.DataFrame, new_df: pd.DataFrame):
     old_retention = [(old_funnel.get(label, 0) / old_start * 100) for label in FUNNEL_LABELS]
     new_retention = [(new_funnel.get(label, 0) / new_start * 100) for label in FUNNEL_LABELS]
 
-    fig = go.Figure()
-
-    # OLD line
-    fig.add_trace(go.Scatter(
-        x=FUNNEL_LABELS,
-        y=old_retention,
-        mode='lines+markers+text',
-        name='OLD Landing',
-        line=dict(color='#FF6B35', width=3),
-        marker=dict(size=12),
-        text=[f"{v:.1f}%" for v in old_retention],
-        textposition="top center"
-    ))
-
-    # NEW line
-    fig.add_trace(go.Scatter(
-        x=FUNNEL_LABELS,
-        y=new_retention,
-        mode='lines+markers+text',
-        name='NEW Landing',
-        line=dict(color='#4ECDC4', width=3),
-        marker=dict(size=12),
-        text=[f"{v:.1f}%" for v in new_retention],
-        textposition="bottom center"
-    ))
-
-    fig.update_layout(
-        title='Drop-off Analysis (% Retention from Start)',
-        xaxis_title='Funnel Step',
-        yaxis_title='% Retention',
-        yaxis=dict(range=[0, 110]),
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-        height=400
+    return go.Figure(
+        data=[
+            # OLD line
+            go.Scatter(
+                x=FUNNEL_LABELS,
+                y=old_retention,
+                mode='lines+markers+text',
+                name='OLD Landing',
+                line=dict(color=OLD_COLOR, width=3),
+                marker=dict(size=12),
+                text=[f"{v:.1f}%" for v in old_retention],
+                textposition="top center"
+            ),
+            # NEW line
+            go.Scatter(
+                x=FUNNEL_LABELS,
+                y=new_retention,
+                mode='lines+markers+text',
+                name='NEW Landing',
+                line=dict(color=NEW_COLOR, width=3),
+                marker=dict(size=12),
+                text=[f"{v:.1f}%" for v in new_retention],
+                textposition="bottom center"
+            )
+        ],
+        layout=go.Layout(
+            title='Drop-off Analysis (% Retention from Start)',
+            xaxis_title='Funnel Step',
+            yaxis_title='% Retention',
+            yaxis=dict(range=[0, 110]),
+            legend=LEGEND_TOP,
+            height=400
+        )
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+
+def render_dropoff_chart(old_events: pd.Series, new_events: pd.Series):
+    """Line chart showing % retention through funnel steps."""
+    fig = build_dropoff_fig(old_events, new_events)
+    if fig is None:
+        st.info("No funnel data available")
+        return
+
+    st.plotly_chart(fig, **_PLOTLY_KW)
 
 
 # =============================================================================
 # 4. STACKED BAR - Event Distribution Comparison
 # =============================================================================
-def render_event_comparison_chart(old_df: pd.DataFrame, new_df: pd.DataFrame):
-    """Stacked bar chart comparing top events between Old and New."""
-    if old_df.empty and new_df.empty:
-        st.info("No data available for event comparison")
-        return
+def build_event_comparison_fig(old_events: pd.Series, new_events: pd.Series):
+    """Grouped bar chart figure of the top events for Old and New (None without event data)."""
+    # Top 12 events by combined OLD + NEW volume (only events that actually occurred)
+    combined = old_events.add(new_events, fill_value=0)
+    events_list = combined[combined > 0].nlargest(12).index
+
+    if events_list.empty:
+        return None
+
+    # Prepare data (arrays go to plotly as-is, no list conversion)
+    old_counts = old_events.reindex(events_list, fill_value=0).to_numpy()
+    new_counts = new_events.reindex(events_list, fill_value=0).to_numpy()
+
+    # Shorten event names for display (vectorized string ops on the index)
+    short_names = events_list.where(events_list.str.len() <= 25, events_list.str.slice(0, 25) + '...').tolist()
+
+    return go.Figure(
+        data=[
+            go.Bar(
+                name='OLD Landing',
+                y=short_names,
+                x=old_counts,
+                orientation='h',
+                marker_color=OLD_COLOR
+            ),
+            go.Bar(
+                name='NEW Landing',
+                y=short_names,
+                x=new_counts,
+                orientation='h',
+                marker_color=NEW_COLOR
+            )
+        ],
+        layout=go.Layout(
+            barmode='group',
+            title='Event Distribution: OLD vs NEW',
+            xaxis_title='Count',
+            yaxis_title='Event Action',
+            legend=LEGEND_TOP,
+            height=500,
+            yaxis={'categoryorder': 'total ascending'}
+        )
+    )
 
-    # Get top 10 events from combined data
-    all_events = set()
-    if not old_df.empty and 'event_action' in old_df.columns:
-        old_events = old_df.groupby('event_action')['count'].sum()
-        all_events.update(old_events.nlargest(10).index.tolist())
-    if not new_df.empty and 'event_action' in new_df.columns:
-        new_events = new_df.groupby('event_action')['count'].sum()
-        all_events.update(new_events.nlargest(10).index.tolist())
 
-    if not all_events:
+def render_event_comparison_chart(old_events: pd.Series, new_events: pd.Series):
+    """Stacked bar chart comparing top events between Old and New."""
+    fig = build_event_comparison_fig(old_events, new_events)
+    if fig is None:
         st.info("No event data available")
         return
 
-    # Prepare data
-    events_list = list(all_events)[:12]  # Limit to 12 events
-    old_counts = []
-    new_counts = []
-
-    for event in events_list:
-        if not old_df.empty and 'event_action' in old_df.columns:
-            old_count = old_df[old_df['event_action'] == event]['count'].sum()
-        else:
-            old_count = 0
-        if not new_df.empty and 'event_action' in new_df.columns:
-            new_count = new_df[new_df['event_action'] == event]['count'].sum()
-        else:
-            new_count = 0
-        old_counts.append(old_count)
-        new_counts.append(new_count)
-
-    # Shorten event names for display
-    short_names = [e[:25] + '...' if len(e) > 25 else e for e in events_list]
-
-    fig = go.Figure()
-
-    fig.add_trace(go.Bar(
-        name='OLD Landing',
-        y=short_names,
-        x=old_counts,
-        orientation='h',
-        marker_color='#FF6B35'
-    ))
-
-    fig.add_trace(go.Bar(
-        name='NEW Landing',
-        y=short_names,
-        x=new_counts,
-        orientation='h',
-        marker_color='#4ECDC4'
-    ))
-
-    fig.update_layout(
-        barmode='group',
-        title='Event Distribution: OLD vs NEW',
-        xaxis_title='Count',
-        yaxis_title='Event Action',
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-        height=500,
-        yaxis={'categoryorder': 'total ascending'}
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(fig, **_PLOTLY_KW)
 
 
 # =============================================================================
@@ -295,24 +316,37 @@ def render_event_comparison_chart(old_df: pd.DataFrame, new_df: pd.DataFrame):
 def render_all_comparison_charts(old_df: pd.DataFrame, new_df: pd.DataFrame):
     """Render all comparison charts in a structured layout."""
 
+    # Single emptiness guard for the whole section; the charts below can
+    # assume at least one landing has rows
+    if old_df.empty and new_df.empty:
+        st.info("No data available for selected filters")
+        return
+
+    # Aggregate each landing once; every chart reads totals derived from these small tables
+    old_agg = get_landing_aggregates(old_df)
+    new_agg = get_landing_aggregates(new_df)
+    # (astype keeps integer counts when a landing is empty and its table has no cells)
+    old_events, old_daily = old_agg.sum(axis=0).astype(np.int64), old_agg.sum(axis=1).astype(np.int64)
+    new_events, new_daily = new_agg.sum(axis=0).astype(np.int64), new_agg.sum(axis=1).astype(np.int64)
+
     # Row 1: KPI Comparison
     st.subheader("1. KPI Comparison")
-    render_kpi_comparison_chart(old_df, new_df)
+    render_kpi_comparison_chart(old_events, new_events)
 
     st.markdown("---")
 
     # Row 2: Daily Trend
     st.subheader("2. Daily Trend")
-    render_trend_comparison_chart(old_df, new_df)
+    render_trend_comparison_chart(old_daily, new_daily)
 
     st.markdown("---")
 
     # Row 3: Drop-off Analysis
     st.subheader("3. Drop-off Analysis")
-    render_dropoff_chart(old_df, new_df)
+    render_dropoff_chart(old_events, new_events)
 
     st.markdown("---")
 
     # Row 4: Event Distribution
     st.subheader("4. Event Distribution")
-    render_event_comparison_chart(old_df, new_df)
+    render_event_comparison_chart(old_events, new_events)